@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import gzip
+import io
+import json
+import os
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Zip record layouts, see the PKWARE APPNOTE
+ZIP_LOCAL = "<4s2B4HL2L2H"
+ZIP_CENTRAL = "<4s4B4HL2L5H2L"
+ZIP_END = "<4s4H2LH"
+
+def archive_kind(path):
+    """
+    Archive kind tells from the file name whether path is a tar.gz or a
+    zip archive.
+    """
+    if path.endswith(".tar.gz") or path.endswith(".tgz"):
+        return "tar.gz"
+    if path.endswith(".zip"):
+        return "zip"
+    raise Exception("Archive must end in .tar.gz, .tgz or .zip")
+
+def dos_time(seconds):
+    """
+    Dos time packs a timestamp into the (time, date) pair zip uses.
+    """
+    t = time.localtime(seconds)
+    return (t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+            (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday)
+
+class ArchiveWriter:
+    """
+    Archive writer puts output files into one compressed archive as
+    they are made, instead of writing them out loose. Members are
+    compressed on a pool of 'workers' threads (zlib lets go of the GIL)
+    and written in the order they were added. A tar.gz is written as
+    one gzip member per file, which any gzip or tar reads as a single
+    stream, so a file can be read back on its own from its offset. Next
+    to the archive an index ('archive.index.json') records where each
+    member starts. Member names are paths relative to 'root'.
+    """
+
+    def __init__(self, path, root=".", workers=4, level=6):
+        self.path = path
+        self.root = root
+        self.kind = archive_kind(path)
+        self.level = level
+        self.workers = max(1, workers)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.index = dict()
+        self.central = list()
+        self.offset = 0
+        self.file = open(path + ".tmp", "wb")
+
+    def add(self, path, data):
+        """
+        Add queues the bytes of the file at 'path' for the archive.
+        """
+        name = os.path.relpath(path, self.root).replace(os.sep, "/")
+        if isinstance(data, str):
+            data = data.encode()
+        future = self.pool.submit(self.compress, name, data, time.time())
+        with self.lock:
+            self.pending.append(future)
+            # Holding at most a couple of compressed members per worker
+            while len(self.pending) > 2 * self.workers or (len(self.pending) > 0 and self.pending[0].done()):
+                self.write(*self.pending.popleft().result())
+
+    def compress(self, name, data, mtime):
+        """
+        Compress makes the archive record of one member, without
+        touching the file, so it can run on any thread.
+        """
+        if self.kind == "tar.gz":
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(mtime)
+            info.mode = 0o644
+            padding = b"\0" * (-len(data) % tarfile.BLOCKSIZE)
+            record = info.tobuf(format=tarfile.PAX_FORMAT) + data + padding
+            return name, gzip.compress(record, compresslevel=self.level, mtime=0), len(data), None, None
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        record = compressor.compress(data) + compressor.flush()
+        return name, record, len(data), zlib.crc32(data), dos_time(mtime)
+
+    def write(self, name, record, size, crc, stamp):
+        """
+        Write appends one compressed member to the archive.
+        """
+        if name in self.index:
+            raise Exception("{} is already in the archive".format(name))
+        offset = self.offset
+        if self.kind == "zip":
+            encoded = name.encode()
+            if offset + len(record) > 0xFFFFFFFF or len(self.central) == 0xFFFF:
+                raise Exception("Output is too big for a zip archive, use .tar.gz")
+            header = struct.pack(ZIP_LOCAL, b"PK\003\004", 20, 0, 0x800, zipfile.ZIP_DEFLATED,
+                                 stamp[0], stamp[1], crc, len(record), size, len(encoded), 0)
+            self.file.write(header + encoded)
+            self.central.append(struct.pack(ZIP_CENTRAL, b"PK\001\002", 20, 3, 20, 0, 0x800, zipfile.ZIP_DEFLATED,
+                                            stamp[0], stamp[1], crc, len(record), size, len(encoded), 0, 0, 0, 0,
+                                            0o644 << 16, offset) + encoded)
+            self.offset = self.offset + len(header) + len(encoded)
+        self.file.write(record)
+        self.offset = self.offset + len(record)
+        self.index[name] = [offset, self.offset - offset, size]
+
+    def close(self):
+        """
+        Close writes whatever is still queued and the end of the
+        archive, then moves the archive and its index into place.
+        """
+        with self.lock:
+            while len(self.pending) > 0:
+                self.write(*self.pending.popleft().result())
+        self.pool.shutdown()
+
+        if self.kind == "tar.gz":
+            self.file.write(gzip.compress(b"\0" * 2 * tarfile.BLOCKSIZE, mtime=0))
+        else:
+            directory = b"".join(self.central)
+            self.file.write(directory)
+            self.file.write(struct.pack(ZIP_END, b"PK\005\006", 0, 0, len(self.central), len(self.central),
+                                        len(directory), self.offset, 0))
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+        with open(index_path(self.path) + ".tmp", "w") as f:
+            json.dump({"format": self.kind, "members": self.index}, f)
+        os.replace(index_path(self.path) + ".tmp", index_path(self.path))
+
+        return self.path
+
+def index_path(path):
+    """
+    Index path is where the index of the archive at path is kept.
+    """
+    return path + ".index.json"
+
+def read_member(path, name):
+    """
+    Read member returns the bytes of one file in an archive written by
+    ArchiveWriter, reading only that member.
+    """
+    with open(index_path(path)) as f:
+        index = json.load(f)
+    if name not in index["members"]:
+        raise Exception("{} is not in {}".format(name, path))
+    if index["format"] == "zip":
+        with zipfile.ZipFile(path) as archive:
+            return archive.read(name)
+
+    offset, length, size = index["members"][name]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        record = gzip.decompress(f.read(length))
+    with tarfile.open(fileobj=io.BytesIO(record)) as member:
+        return member.extractfile(member.next()).read()
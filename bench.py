@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from frames import FIELDS, NAMES, align_panel, build_panel, write_frame
+from horizons import panel_returns
+from regress import fit_returns, market_return
+
+def synthetic_ticker(tag, dates, rng, gaps=0.0):
+    """
+    Synthetic ticker makes a DataFrame shaped like the one
+    pdr.get_data_yahoo returns (Open, High, Low, Close, Adj Close and
+    Volume on a DatetimeIndex named 'Date') from a random walk, with the
+    'Ticker' column fetch_ticker adds. A share 'gaps' of the days is
+    left out at random so alignment has work to do.
+    """
+    n = len(dates)
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.01, n)))
+    volume = rng.integers(100000, 10000000, n)
+
+    data = pd.DataFrame({
+        "High": high,
+        "Low": low,
+        "Open": open_,
+        "Close": close,
+        "Volume": volume,
+        "Adj Close": close * 0.98,
+    }, index=dates)
+    data.index.name = "Date"
+    if gaps > 0:
+        data = data[rng.random(n) >= gaps]
+    data["Ticker"] = tag
+
+    return data
+
+def synthetic_universe(tickers, years, seed=0, gaps=0.001):
+    """
+    Synthetic universe makes one synthetic DataFrame per ticker, as
+    fetch_all would return them.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2000-01-03", periods=252 * years)
+    return [synthetic_ticker("T{:05d}".format(i), dates, rng, gaps) for i in range(tickers)]
+
+def timed(results, stage, function, *args):
+    """
+    Timed runs function, stores its wall time in seconds in results
+    under stage and returns what it returned.
+    """
+    begin = time.perf_counter()
+    value = function(*args)
+    results[stage] = time.perf_counter() - begin
+    return value
+
+def bench(tickers, years, folder):
+    """
+    Bench runs each stage of the external.py pipeline on a synthetic
+    universe, calling the same functions external.py does, and returns
+    a dict of stage name to seconds.
+    """
+    data_list = synthetic_universe(tickers, years)
+    results = dict()
+
+    panel = timed(results, "extract", build_panel, data_list)
+    panel, gaps = timed(results, "align", align_panel, panel)
+    frames = timed(results, "frames", lambda: [panel[field] for field in FIELDS])
+
+    def write():
+        for frame, name in zip(frames, NAMES):
+            write_frame(frame, os.path.join(folder, name))
+    timed(results, "csv", write)
+
+    returns = timed(results, "pct_change", panel_returns, panel, FIELDS)
+    timed(results, "regression", lambda: [fit_returns(frame, market_return(frame)) for frame in returns.values()])
+
+    return results
+
+if __name__=="__main__":
+
+    # Setting the command line options
+    parser = argparse.ArgumentParser("bench")
+    parser.add_argument("-t", "--tickers", help="Universe sizes to run, separated by commas", default="30,500,5000")
+    parser.add_argument("-y", "--years", help="History lengths in years to run, separated by commas", default="1,30")
+    parser.add_argument("-n", "--repeat", help="Times to run each size, the fastest run is kept", default=1, type=int)
+    parser.add_argument("-o", "--output", help="File to write the JSON results to, prints them if empty", default="")
+
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "runs": list(),
+    }
+    folder = tempfile.mkdtemp(prefix="bench")
+    try:
+        for tickers in [int(x) for x in args.tickers.split(",")]:
+            for years in [int(x) for x in args.years.split(",")]:
+                best = dict()
+                for _ in range(args.repeat):
+                    for stage, seconds in bench(tickers, years, folder).items():
+                        best[stage] = min(seconds, best.get(stage, seconds))
+                print("{} TICKERS, {} YEARS: {:.3f}s".format(tickers, years, sum(best.values())), file=sys.stderr)
+                report["runs"].append({"tickers": tickers, "years": years, "seconds": best})
+    finally:
+        shutil.rmtree(folder)
+
+    if args.output == "":
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import threading
+import time
+import pandas as pd
+
+class TickerCache:
+    """
+    Ticker cache keeps everything yahoo finance has returned for a
+    symbol on disk, one pickle per symbol, together with the date spans
+    that have already been asked for. A request only goes over the
+    network for the parts of the date range that are not covered yet.
+    Once the cache grows past 'max_bytes' the least recently used
+    symbols are thrown away.
+    """
+
+    def __init__(self, root, source, max_bytes=0):
+        self.root = root
+        self.source = source
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bytes_saved": 0}
+
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, "index.json")
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = dict()
+
+    def path(self, tag):
+        """
+        Path gives the pickle file for a symbol. Symbols like 'GC=F' or
+        'BRK/B' are made safe to use as file names.
+        """
+        return os.path.join(self.root, tag.replace("/", "_") + ".pkl")
+
+    def missing(self, tag, start, end):
+        """
+        Missing returns the list of (start, end) spans between start and
+        end, both inclusive, that have never been fetched for tag.
+        """
+        spans = list()
+        if tag in self.index:
+            spans = sorted(self.index[tag]["spans"])
+
+        gaps = list()
+        cursor = start
+        for lo, hi in spans:
+            lo = datetime.date.fromisoformat(lo)
+            hi = datetime.date.fromisoformat(hi)
+            if hi < cursor:
+                continue
+            if lo > end:
+                break
+            if lo > cursor:
+                gaps.append((cursor, lo - datetime.timedelta(days=1)))
+            cursor = max(cursor, hi + datetime.timedelta(days=1))
+        if cursor <= end:
+            gaps.append((cursor, end))
+
+        return gaps
+
+    def cover(self, tag, start, end):
+        """
+        Cover records that start to end has been fetched for tag,
+        merging it with any span it touches. Today is never marked as
+        covered since its bar is still changing.
+        """
+        last = datetime.date.today() - datetime.timedelta(days=1)
+        end = min(end, last)
+        if end < start:
+            return
+
+        spans = [(datetime.date.fromisoformat(lo), datetime.date.fromisoformat(hi))
+                 for lo, hi in self.index[tag]["spans"]]
+        spans.append((start, end))
+        spans.sort()
+
+        merged = [spans[0]]
+        for lo, hi in spans[1:]:
+            if lo <= merged[-1][1] + datetime.timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+            else:
+                merged.append((lo, hi))
+        self.index[tag]["spans"] = [[lo.isoformat(), hi.isoformat()] for lo, hi in merged]
+
+    def fetch(self, tag, start, end, timeout=30):
+        """
+        Fetch has the same signature as external.fetch_ticker so it can
+        be handed straight to fetch_all. Cached rows are read from disk,
+        missing spans are downloaded from the source and merged in.
+        """
+        if isinstance(start, datetime.datetime):
+            start = start.date()
+        if isinstance(end, datetime.datetime):
+            end = end.date()
+
+        with self.lock:
+            if tag not in self.index:
+                self.index[tag] = {"spans": list(), "bytes": 0, "used": 0}
+            gaps = self.missing(tag, start, end)
+            cached = None
+            if os.path.exists(self.path(tag)):
+                cached = pd.read_pickle(self.path(tag))
+
+        # Downloading only the spans the cache does not have yet
+        fetched = list()
+        for lo, hi in gaps:
+            if len(pd.bdate_range(lo, hi)) == 0: # Nothing trades on a weekend, no need to ask
+                fetched.append((lo, hi, None))
+                continue
+            try:
+                fetched.append((lo, hi, self.source(tag, lo, hi, timeout)))
+            except Exception:
+                print("COULD NOT FILL {} FROM {} TO {}".format(tag, lo, hi))
+
+        with self.lock:
+            frames = [data for lo, hi, data in fetched if data is not None]
+            if cached is not None:
+                frames.insert(0, cached)
+            if len(frames) == 0:
+                self.stats["misses"] = self.stats["misses"] + len(gaps)
+                raise Exception("No data for {}".format(tag))
+
+            table = pd.concat(frames)
+            table = table[~table.index.duplicated(keep="last")].sort_index()
+            data = table.loc[str(start):str(end)]
+
+            if len(gaps) == 0:
+                self.stats["hits"] = self.stats["hits"] + 1
+            else:
+                self.stats["misses"] = self.stats["misses"] + len(gaps)
+            if cached is not None and len(cached) > 0:
+                # Bytes saved is the share of the cached file that did not need downloading
+                served = len(cached.loc[str(start):str(end)])
+                row_bytes = self.index[tag]["bytes"] / len(cached)
+                self.stats["bytes_saved"] = self.stats["bytes_saved"] + int(served * row_bytes)
+
+            if len(fetched) > 0:
+                table.to_pickle(self.path(tag))
+                self.index[tag]["bytes"] = os.path.getsize(self.path(tag))
+                for lo, hi, _ in fetched:
+                    self.cover(tag, lo, hi)
+            self.index[tag]["used"] = time.time()
+
+        return data.copy()
+
+    def evict(self):
+        """
+        Evict removes the least recently used symbols until the cache
+        fits in max_bytes. A max_bytes of 0 means there is no cap.
+        """
+        if self.max_bytes <= 0:
+            return
+
+        total = sum(entry["bytes"] for entry in self.index.values())
+        for tag in sorted(self.index, key=lambda tag: self.index[tag]["used"]):
+            if total <= self.max_bytes:
+                break
+            total = total - self.index[tag]["bytes"]
+            if os.path.exists(self.path(tag)):
+                os.remove(self.path(tag))
+            del self.index[tag]
+
+    def save(self):
+        """
+        Save applies the size cap and writes the span index back to disk.
+        """
+        with self.lock:
+            self.evict()
+            tmp = self.index_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.index, f)
+            os.replace(tmp, self.index_path)
+
+    def summary(self):
+        """
+        Summary returns a one line description of the cache statistics.
+        """
+        return "Cache hits: {}, misses: {}, bytes saved: {}".format(
+            self.stats["hits"], self.stats["misses"], self.stats["bytes_saved"])
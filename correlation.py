@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from frames import EXTENSIONS, load_frame, write_frame
+
+def _pair_sums(X, W, i, j):
+    """
+    Pair sums returns, for column blocks i and j, the number of days
+    both tickers of each pair have a value and the covariance and
+    variance sums over just those days.
+    """
+    Xi, Wi, Xj, Wj = X[:, i], W[:, i], X[:, j], W[:, j]
+    n = Wi.T @ Wj
+    sx = Xi.T @ Wj
+    sy = Wi.T @ Xj
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cxy = Xi.T @ Xj - sx * sy / n
+        cxx = (Xi * Xi).T @ Wj - sx * sx / n
+        cyy = Wi.T @ (Xj * Xj) - sy * sy / n
+
+    return n, cxy, cxx, cyy
+
+def block_matrices(returns, block=256, workers=4, shrinkage=0.0, min_periods=2):
+    """
+    Block matrices computes the ticker x ticker covariance and
+    correlation of the returns panel. Missing values are handled
+    pairwise, like DataFrame.corr, but the work is split into blocks of
+    'block' columns so only two blocks of sums are alive per worker,
+    and the blocks are spread over 'workers' threads (numpy releases
+    the GIL in matrix products). A 'shrinkage' between 0 and 1 pulls the
+    covariance towards its average variance times the identity, and
+    the correlation towards the identity. Returns (cov, corr).
+    """
+    X = returns.to_numpy(dtype=np.float64)
+    W = np.isfinite(X).astype(np.float64)
+    X = np.where(W > 0, X, 0)
+    size = X.shape[1]
+    cov = np.full((size, size), np.nan)
+    corr = np.full((size, size), np.nan)
+
+    blocks = [slice(lo, min(lo + block, size)) for lo in range(0, size, block)]
+    pairs = [(a, b) for a in range(len(blocks)) for b in range(a, len(blocks))]
+
+    def work(pair):
+        i, j = blocks[pair[0]], blocks[pair[1]]
+        n, cxy, cxx, cyy = _pair_sums(X, W, i, j)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            c = cxy / (n - 1)
+            r = cxy / np.sqrt(cxx * cyy)
+        c[n < min_periods] = np.nan
+        r[n < min_periods] = np.nan
+        cov[i, j] = c
+        cov[j, i] = c.T
+        corr[i, j] = r
+        corr[j, i] = r.T
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(work, pairs))
+
+    if shrinkage > 0: # Shrinking towards a scaled identity
+        target = np.nanmean(np.diag(cov))
+        cov = (1 - shrinkage) * cov + shrinkage * target * np.eye(size)
+        corr = (1 - shrinkage) * corr + shrinkage * np.eye(size)
+    np.fill_diagonal(corr, np.where(np.isnan(np.diag(corr)), np.nan, 1.0))
+
+    cov = pd.DataFrame(cov, index=returns.columns, columns=returns.columns)
+    corr = pd.DataFrame(corr, index=returns.columns, columns=returns.columns)
+
+    return cov, corr
+
+def input_hash(returns, **options):
+    """
+    Input hash is a digest of the returns panel and the options used,
+    so the same input always maps to the same cache file.
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(returns.to_numpy(dtype=np.float64)).tobytes())
+    digest.update("|".join(str(column) for column in returns.columns).encode())
+    digest.update("|".join(str(date) for date in returns.index).encode())
+    digest.update(repr(sorted(options.items())).encode())
+
+    return digest.hexdigest()
+
+def cached_matrices(returns, cache="", block=256, workers=4, shrinkage=0.0, min_periods=2):
+    """
+    Cached matrices is block_matrices with a disk cache in the directory
+    'cache', keyed by the input hash. An empty cache means no caching.
+    """
+    if cache == "":
+        return block_matrices(returns, block, workers, shrinkage, min_periods)
+
+    key = input_hash(returns, shrinkage=shrinkage, min_periods=min_periods)
+    path = os.path.join(cache, "{}.npz".format(key))
+    if os.path.exists(path):
+        stored = np.load(path)
+        cov = pd.DataFrame(stored["cov"], index=returns.columns, columns=returns.columns)
+        corr = pd.DataFrame(stored["corr"], index=returns.columns, columns=returns.columns)
+        return cov, corr
+
+    cov, corr = block_matrices(returns, block, workers, shrinkage, min_periods)
+    os.makedirs(cache, exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, cov=cov.to_numpy(), corr=corr.to_numpy())
+    os.replace(tmp, path)
+
+    return cov, corr
+
+if __name__=="__main__":
+
+    # Setting the command line options
+    parser = argparse.ArgumentParser("correlation")
+    parser.add_argument("returns", help="Returns file written by external.py -r, like close_pct_change.csv")
+    parser.add_argument("-b", "--block", help="Number of tickers in each block", default=256, type=int)
+    parser.add_argument("-w", "--workers", help="Number of threads to use", default=4, type=int)
+    parser.add_argument("--shrinkage", help="How much to shrink towards the identity, between 0 and 1", default=0.0, type=float)
+    parser.add_argument("--cache", help="Directory to cache finished matrices in", default="")
+    parser.add_argument("-f", "--format", help="File format of the output", default="csv", choices=list(EXTENSIONS))
+
+    args = parser.parse_args()
+
+    returns = load_frame(args.returns)
+    cov, corr = cached_matrices(returns, args.cache, args.block, args.workers, args.shrinkage)
+
+    # Writing next to the input file
+    base = os.path.splitext(args.returns)[0]
+    write_frame(cov, "{}_cov".format(base), args.format)
+    write_frame(corr, "{}_corr".format(base), args.format)
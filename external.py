@@ -2,27 +2,68 @@
 
 import argparse
 import datetime
+import io
+import json
 import requests
 import os
+import pickle
+import shutil
+import tempfile
+import time
 import unicodedata
 import numpy as np
 import pandas as pd
-import pandas_datareader as pdr
-import statsmodels.formula.api as sm
-from bs4 import BeautifulSoup
-from functools import reduce
+from bs4 import BeautifulSoup, SoupStrainer
+from frames import EXTENSIONS, FIELDS, NAMES, align_panel, build_panel, compact_column, load_frame, place_ticker, write_frame
+from archive import ArchiveWriter
+from cache import TickerCache
+from horizons import KINDS, NANS, panel_returns, returns_name, write_returns
+from indicators import INPUTS, Indicators
+from regress import RollingBeta, fit_returns, market_return, rolling_beta
+from store import save_panel
+from universe import UniverseResolver
+from membership import MembershipStore
+from profiler import Profiler
+from shard import shard_panels
+from sources import FallbackSource, LocalSource, RecordingSource, YahooSource
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def get_Dow():
+# File in the output directory the indicators keep their state in between runs
+INDICATORS_STATE = ".indicators.pkl"
+
+# File in the output directory the settings of the -r returns are kept in for --update
+RETURNS_STATE = ".returns.json"
+
+# File in the output directory the running sums of the --rolling fits are kept in for --update
+ROLLING_STATE = ".rolling.pkl"
+
+# Pages the index members are scraped from
+DOW_URL = "https://money.cnn.com/data/dow30/"
+SP_URL = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+COMMODITIES_URL = "https://finance.yahoo.com/commodities"
+CURRENCY_URL = "https://xe.com/symbols.php"
+
+# lxml parses much faster than the built in parser when it is installed
+try:
+    import lxml
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+def get_Dow(content=None):
     """
     Get dow uses Beautiful Soup to scrape the money.cnn website
     in order to get a list of all the symbols used in the
     Dow Jones Industrial Average. This function is only called
     if the user passes the '-d' or '--dow' option in the command line.
+    The page can be passed in as content if it was already downloaded.
     """
 
     # Request website
-    Dow_Website = requests.get("https://money.cnn.com/data/dow30/")
-    soup = BeautifulSoup(Dow_Website.content, "html.parser")
+    if content is None:
+        content = requests.get(DOW_URL).content
+    only = SoupStrainer("div", {"id": "wsod_indexConstituents"})
+    soup = BeautifulSoup(content, PARSER, parse_only=only)
 
     # Find the table with the symbols
     Dow_Table = soup.find("div", {"id": "wsod_indexConstituents"})
@@ -43,16 +84,19 @@ def get_Dow():
 
     return Dow_tags
 
-def get_SP(): 
+def get_SP(content=None):
     """
     This function scrapes wikipedia in order to get all of the symbols
     included in the S&P 500. This function is only called if the user
-    uses the '-p' or '--sp' flags in the command line.
+    uses the '-p' or '--sp' flags in the command line. The page can be
+    passed in as content if it was already downloaded.
     """
 
     # Request Website
-    SP_Website = requests.get("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies")
-    soup = BeautifulSoup(SP_Website.content, "html.parser")
+    if content is None:
+        content = requests.get(SP_URL).content
+    only = SoupStrainer("table", {"id": "constituents"})
+    soup = BeautifulSoup(content, PARSER, parse_only=only)
 
     # Find table with symbols
     SP_Table = soup.find("table", {"id": "constituents"})
@@ -73,14 +117,16 @@ def get_SP():
 
     return SP_tags
 
-def get_commodities():
+def get_commodities(content=None):
     """
     Get commodities scrapes yahoo finance in order to return a list 
     of all the commodities symbols. This function is only called if the
     user uses the '-o' or '--commodities' flags in the command line 
     """
-    comm_website = requests.get("https://finance.yahoo.com/commodities")
-    soup = BeautifulSoup(comm_website.content, "html.parser")
+    if content is None:
+        content = requests.get(COMMODITIES_URL).content
+    only = SoupStrainer("a", {"data-symbol": True})
+    soup = BeautifulSoup(content, PARSER, parse_only=only)
     commodities = soup.findAll("a", {"class":"Fw(b)", "data-symbol":True})
 
     titles = {}
@@ -98,14 +144,16 @@ def get_commodities():
     # return tickers 
     return commodities
 
-def get_currency():
+def get_currency(content=None):
     """
     Get currency scrapes the xe website in order to get a list of all
     the currency symbols. This function is only called if the user uses
     the '-c' or '--currency' flags.
     """
-    site = requests.get("https://xe.com/symbols.php")
-    soup = BeautifulSoup(site.content, "html.parser")
+    if content is None:
+        content = requests.get(CURRENCY_URL).content
+    only = SoupStrainer("table", {"class": "currencySymblTable"})
+    soup = BeautifulSoup(content, PARSER, parse_only=only)
     table = soup.find("table", {"class": "currencySymblTable"})
     rows = table.find_all("tr")
 
@@ -123,275 +171,859 @@ def get_currency():
 
     return currencies
 
-if __name__=="__main__":
+def fetch_ticker(tag, start, end, timeout=30):
+    """
+    Fetch ticker downloads the daily history of a single symbol from
+    yahoo finance and tags every row with that symbol. The timeout is
+    passed down to the underlying http request so one slow symbol can
+    not hold up a worker forever.
+    """
+    return YahooSource().fetch(tag, start, end, timeout)
+
+def compact_frame(data, tickers):
+    """
+    Compact frame shrinks one download: prices become float32, volume a
+    nullable int64 and the ticker a categorical over every ticker of
+    the run, so once all downloads are concatenated the ticker is a
+    small integer code per row instead of a string.
+    """
+    columns = dict()
+    for column in data.columns:
+        if column == "Ticker":
+            columns[column] = pd.Categorical(data[column], categories=tickers)
+        else:
+            columns[column] = compact_column(data[column], column)
+
+    return pd.DataFrame(columns, index=data.index)
+
+def panel_bytes(panel):
+    """
+    Panel bytes returns how much memory the panel's values take, and how
+    much they would take as float64.
+    """
+    used = sum(int(frame.memory_usage(index=False).sum()) for frame in panel.values())
+    wide = sum(frame.size * 8 for frame in panel.values())
+
+    return used, wide
+
+def fetch_all(tickers, start, end, workers=1, timeout=30, fetch=fetch_ticker, on_data=None, retries=0, fields=None, compact=False):
+    """
+    Fetch all downloads every symbol in tickers using a pool of at most
+    'workers' threads, so there are never more than 'workers' requests
+    in flight. The returned list is always in sorted ticker order, no
+    matter which download finished first, so the csv's written from it
+    are identical to a serial run. Symbols that fail are left out.
+    The 'fetch' argument can be swapped out to point at another source.
+    If 'on_data' is given every DataFrame is handed to it as soon as it
+    arrives instead of being kept, and an empty list is returned.
+    A failed ticker is tried again up to 'retries' more times. If
+    'fields' is given only those columns are kept from each download,
+    straight away in the worker thread, and with 'compact' the download
+    is passed through compact_frame there too.
+    """
+    tickers = sorted(tickers)
+    results = [None] * len(tickers)
+    done = 0
+
+    def attempt(tag):
+        for tries in range(retries + 1):
+            try:
+                data = fetch(tag, start, end, timeout)
+                if fields is not None:
+                    data = data[list(fields) + ["Ticker"]]
+                if compact:
+                    data = compact_frame(data, tickers)
+                return data
+            except Exception:
+                if tries == retries:
+                    raise
+                time.sleep(0.5 * (tries + 1))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = dict()
+        for i, tag in enumerate(tickers):
+            futures[pool.submit(attempt, tag)] = i
+
+        for future in as_completed(futures):
+            i = futures[future]
+            done = done + 1
+            try:
+                data = future.result()
+                if on_data is None:
+                    results[i] = data
+                else:
+                    on_data(data)
+                print("Working on : {}, {} OUT OF {}".format(tickers[i], done, len(tickers)))
+            except Exception: # Data returned by yfinance was None or the request timed out
+                print("DATA NOT FOUND FOR {}, LIKELY A WEEKEND".format(tickers[i]))
+
+    return [data for data in results if data is not None]
+
+def write_ticker(frame, tag, fields=FIELDS, names=NAMES, root=".", fmt="csv", compression=None, combined=False, archive=None):
+    """
+    Write ticker writes the fields of one ticker, given as a DataFrame
+    with one column per field, into the folder root/tag. Each field goes
+    to its own file, or with 'combined' all of them go into one file
+    named 'all'. The folder has to exist already, unless the files go
+    into an archive.
+    """
+    folder = os.path.join(root, tag)
+    if combined:
+        frame = frame[fields].set_axis(names, axis=1)
+        frame.index.name = "Dates"
+        write_frame(frame, os.path.join(folder, "all"), fmt, compression, archive)
+        return
+
+    for field, name in zip(fields, names):
+        single = frame[[field]].set_axis([tag], axis=1)
+        single.index.name = "Dates"
+        write_frame(single, os.path.join(folder, name), fmt, compression, archive)
+
+def write_tickers(panel, fields=FIELDS, names=NAMES, root=".", fmt="csv", compression=None, combined=False, workers=4, archive=None):
+    """
+    Write tickers writes the per ticker folders of verbose mode from an
+    aligned panel. Every folder is made up front in this process, then
+    the files are written by a pool of 'workers' threads.
+    """
+    tickers = list(panel[fields[0]].columns)
+    if archive is None:
+        for tag in tickers:
+            os.makedirs(os.path.join(root, tag), exist_ok=True)
+
+    def write(tag):
+        frame = pd.DataFrame({field: panel[field][tag] for field in fields})
+        write_ticker(frame, tag, fields, names, root, fmt, compression, combined, archive)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(write, tickers))
+
+class StreamWriter:
+    """
+    Stream writer takes each ticker as soon as it is downloaded so the
+    whole universe never has to be held in memory. Every value is
+    dropped into a memory mapped spool file of shape (field, day,
+    ticker) on a calendar of every day from start to end, and close()
+    writes the files from it, a block of dates or tickers at a time.
+    The files come out the same as get_panels and write_frame or
+    write_tickers would write them: the days nobody traded are left
+    out and a field that only ever held whole numbers with no gaps
+    stays integer. Everything is written under 'root', or into
+    'archive' if one is given.
+    """
+
+    def __init__(self, tickers, start, end, fields=FIELDS, names=NAMES, fmt="csv", compression=None,
+                 verbose=False, join="outer", fill="none", block=256, root=".", combined=False, archive=None):
+        self.tickers = sorted(tickers)
+        self.columns = {tag: i for i, tag in enumerate(self.tickers)}
+        self.seen = np.zeros(len(self.tickers), dtype=bool)
+        self.fields = fields
+        self.names = names
+        self.fmt = fmt
+        self.compression = compression
+        self.verbose = verbose
+        self.join = join
+        self.fill = fill
+        self.block = block
+        self.root = root
+        self.combined = combined
+        self.archive = archive
+
+        if not verbose:
+            if fmt != "csv":
+                raise Exception("Streaming wide output can only be written as csv")
+            if fill == "bfill":
+                raise Exception("Streaming wide output can not fill backwards")
+        self.dates = pd.date_range(start, end, freq="D", name="Dates")
+        self.stamped = np.zeros(len(self.dates), dtype=bool)
+        self.integer = np.ones(len(fields), dtype=bool)
+        self.spool = tempfile.mkdtemp(prefix=".stream", dir=root)
+        shape = (len(fields), len(self.dates), len(self.tickers))
+        self.values = np.lib.format.open_memmap(os.path.join(self.spool, "spool.npy"), mode="w+", dtype=np.float64, shape=shape)
+        self.values[:] = np.nan
+
+    def add(self, data):
+        """
+        Add takes one DataFrame from fetch_all and puts it in the spool.
+        Only daily data between start and end fits on the calendar.
+        """
+        column = self.columns[data["Ticker"].iloc[0]]
+        self.seen[column] = True
+        self.stamped[place_ticker(self.values, self.dates, column, data, self.fields)] = True
+        for i, field in enumerate(self.fields):
+            if not pd.api.types.is_integer_dtype(data[field].dtype):
+                self.integer[i] = False
+
+    def close(self):
+        """
+        Close writes the wide files, or the per ticker folders in
+        verbose mode, then removes the spool. Returns a dict of ticker
+        to the number of trading days it was missing.
+        """
+        rows = np.flatnonzero(self.stamped)
+        cols = np.flatnonzero(self.seen)
+
+        # Finding which days each ticker traded, and which integer fields have no gaps, a block of dates at a time
+        present = np.zeros((len(rows), len(cols)), dtype=bool)
+        whole = self.integer.copy()
+        for lo in range(0, len(rows), self.block):
+            for i in range(len(self.fields)):
+                block = self.values[i, rows[lo:lo + self.block]][:, cols]
+                present[lo:lo + self.block] |= ~np.isnan(block)
+                whole[i] = whole[i] and not np.isnan(block).any()
+        traded = present.any(axis=1)
+        rows = rows[traded]
+        present = present[traded]
+        keep = rows if self.join == "outer" else rows[present.all(axis=1)]
+        cols = cols[present.any(axis=0)]
+        if len(cols) == 0:
+            del self.values
+            shutil.rmtree(self.spool)
+            raise Exception("No data was found for any of the tickers")
+        tickers = [self.tickers[j] for j in cols]
+        missing = (~present[:, present.any(axis=0)]).sum(axis=0)
+        gaps = {tickers[j]: int(missing[j]) for j in np.flatnonzero(missing)}
+
+        if self.verbose:
+            self.write_tickers(keep, cols, whole)
+        else:
+            self.write_wide(keep, cols, whole)
+
+        del self.values
+        shutil.rmtree(self.spool)
+        return gaps
+
+    def write_wide(self, keep, cols, whole):
+        """
+        Write wide writes one file per field, a block of dates at a
+        time, carrying the last row over so filling sees the block
+        before.
+        """
+        tickers = [self.tickers[j] for j in cols]
+        for i, name in enumerate(self.names):
+            path = os.path.join(self.root, "{}.csv".format(name))
+            f = open(path, "w") if self.archive is None else io.StringIO()
+            carry = None
+            for lo in range(0, len(keep), self.block):
+                rows = keep[lo:lo + self.block]
+                frame = pd.DataFrame(self.values[i, rows][:, cols], index=self.dates[rows], columns=tickers)
+                if carry is not None:
+                    frame = pd.concat([carry, frame])
+                if self.fill == "ffill":
+                    frame = frame.ffill()
+                out = frame.iloc[0 if carry is None else 1:]
+                if whole[i]:
+                    out = out.astype(np.int64)
+                out.to_csv(f, header=carry is None)
+                carry = frame.iloc[-1:]
+            if carry is None: # Nobody traded, still writing the header
+                pd.DataFrame(columns=tickers, index=self.dates[:0]).to_csv(f)
+            if self.archive is not None:
+                self.archive.add(path, f.getvalue())
+            f.close()
+
+    def write_tickers(self, keep, cols, whole):
+        """
+        Write tickers writes the per ticker folders, every ticker on
+        the same master index of days like write_tickers, reading a
+        block of tickers from the spool at a time.
+        """
+        dates = self.dates[keep]
+        for lo in range(0, len(cols), self.block):
+            chunk = cols[lo:lo + self.block]
+            block = self.values[:, :, chunk[0]:chunk[-1] + 1][:, keep][:, :, chunk - chunk[0]]
+            for j, column in enumerate(chunk):
+                tag = self.tickers[column]
+                frame = pd.DataFrame({field: block[i, :, j] for i, field in enumerate(self.fields)}, index=dates)
+                if self.fill == "ffill":
+                    frame = frame.ffill()
+                elif self.fill == "bfill":
+                    frame = frame.bfill()
+                frame = frame.astype({field: np.int64 for i, field in enumerate(self.fields) if whole[i]})
+                if self.archive is None:
+                    os.makedirs(os.path.join(self.root, tag), exist_ok=True)
+                write_ticker(frame, tag, self.fields, self.names, self.root, self.fmt, self.compression, self.combined, self.archive)
+
+def parse_date(date, what="Date"):
+    """
+    Parse date accepts a datetime, a date or a YYYY-MM-DD string and
+    returns a datetime.
+    """
+    if isinstance(date, datetime.datetime):
+        return date
+    if isinstance(date, datetime.date):
+        return datetime.datetime(date.year, date.month, date.day)
+    try:
+        return datetime.datetime.strptime(date, "%Y-%m-%d")
+    except:
+        raise Exception("{} must be in YYYY-MM-DD format".format(what))
+
+def get_universe(dow=False, sp=False, currency=False, commodities=False, manual=None,
+                 universe_cache="", ttl=24 * 60 * 60, snapshots="", point_in_time=False, start=None, end=None):
+    """
+    Get universe returns the sorted list of tickers in the chosen
+    indexes plus any 'manual' tickers. The index pages are scraped at
+    the same time and cached in 'universe_cache' for 'ttl' seconds. With
+    'snapshots' a dated record of the members is kept, and with
+    'point_in_time' every ticker that was a member between start and
+    end is used instead of today's members.
+    """
+    sources = dict()
+    if dow:
+        sources["dow"] = (DOW_URL, get_Dow)
+    if sp:
+        sources["sp"] = (SP_URL, get_SP)
+    if currency:
+        sources["currency"] = (CURRENCY_URL, get_currency)
+    if commodities:
+        sources["commodities"] = (COMMODITIES_URL, get_commodities)
+    resolver = UniverseResolver(universe_cache, ttl=ttl)
+    members = resolver.resolve(sources)
+
+    if snapshots != "": # Keeping a dated record of who is in each index
+        memberships = MembershipStore(snapshots)
+        for name in members:
+            added, removed, unchanged = memberships.record(name, members[name])
+            print("{}: {} ADDED, {} REMOVED, {} UNCHANGED".format(name, len(added), len(removed), len(unchanged)))
+            if point_in_time:
+                past = memberships.between(name, parse_date(start).date(), parse_date(end).date())
+                if past is None:
+                    print("NO {} SNAPSHOT BEFORE {}, USING TODAY'S MEMBERS".format(name, end))
+                else:
+                    members[name] = past
+
+    # Adding all requested symbols to the tickers list
+    tickers = set()
+    for name in members:
+        tickers = tickers.union(set(members[name]))
+    if manual is not None:
+        tickers = tickers.union(set(manual))
+
+    # Sorting the tickers so every run writes its columns in the same order
+    return sorted(tickers)
+
+def make_source(source="yahoo", local="", record="", fallback=""):
+    """
+    Make source picks where the data comes from: 'yahoo', or 'local' to
+    replay the output directory 'local'. With 'record' every download
+    is also saved there for replaying later, and with 'fallback' any
+    ticker the source fails on is read from that output directory.
+    Returns the source's fetch function.
+    """
+    if source == "local":
+        if local == "":
+            raise Exception("The local source needs a directory to read from")
+        chosen = LocalSource(local)
+    else:
+        chosen = YahooSource()
+    if record != "":
+        chosen = RecordingSource(chosen, record)
+    if fallback != "":
+        chosen = FallbackSource(chosen, LocalSource(fallback))
+
+    return chosen.fetch
+
+def make_fetch(cache="", cache_size=0, profiler=None, fetch=fetch_ticker):
+    """
+    Make fetch wraps the fetch function with the profiler, if any, and
+    the disk cache in directory 'cache', if any. Returns the fetch
+    function and the TickerCache or None.
+    """
+    if profiler is not None:
+        fetch = profiler.timed_fetch(fetch)
+    if cache == "":
+        return fetch, None
+
+    ticker_cache = TickerCache(cache, fetch, max_bytes=int(cache_size * 1024 * 1024))
+    return ticker_cache.fetch, ticker_cache
+
+def fetch_data(tickers, start, end, fields=FIELDS, workers=1, timeout=30, retries=0, cache="", cache_size=0,
+               fetch=fetch_ticker, profiler=None, compact=False):
+    """
+    Fetch data downloads 'tickers' from start to end through the disk
+    cache, if any, and returns the list of per ticker DataFrames from
+    fetch_all, which is empty if nothing was found.
+    """
+    if profiler is None:
+        profiler = Profiler()
+    start = parse_date(start, "Start date")
+    end = parse_date(end, "End date")
+
+    profiler.stage("fetch")
+    fetch, ticker_cache = make_fetch(cache, cache_size, profiler, fetch)
+    data_list = fetch_all(tickers, start, end, workers=workers, timeout=timeout, fetch=fetch, retries=retries, fields=fields,
+                          compact=compact)
+    if ticker_cache is not None:
+        ticker_cache.save()
+        print(ticker_cache.summary())
+
+    return data_list
+
+def get_panels(tickers, start, end, fields=FIELDS, join="outer", fill="none", workers=1, timeout=30,
+               retries=0, cache="", cache_size=0, fetch=fetch_ticker, profiler=None, compact=False):
+    """
+    Get panels is the entry point for using this module as a library.
+    It downloads 'tickers' from start to end (datetimes, dates or
+    YYYY-MM-DD strings) and returns the aligned panel, a dict of field
+    name to (date x ticker) DataFrame, and a dict of ticker to the
+    number of trading days it was missing. The other arguments are the
+    same as the command line options. For example:
+
+        panel, gaps = get_panels(["AAPL", "MSFT"], "2020-01-01", "2020-06-30", fields=["Close"])
+        closes = panel["Close"]
+
+    With 'compact' prices are kept as float32 and volume as a nullable
+    int64, see compact_frame.
+    """
+    if profiler is None:
+        profiler = Profiler()
+    data_list = fetch_data(tickers, start, end, fields, workers, timeout, retries, cache, cache_size, fetch, profiler, compact)
+
+    # Make one wide table per datapoint with all the combined data
+    profiler.stage("panel")
+    return align_panel(build_panel(data_list, fields), join=join, fill=fill)
+
+def panel_array(panel):
+    """
+    Panel array turns a panel from get_panels into one float64 numpy
+    array of shape (field, date, ticker), along with the date index and
+    the ticker names.
+    """
+    fields = list(panel)
+    first = panel[fields[0]]
+    values = np.stack([panel[field].to_numpy(dtype=np.float64, na_value=np.nan) for field in fields])
+
+    return values, first.index, list(first.columns)
+
+def read_last_rows(path, rows=1):
+    """
+    Read last rows returns the header and the last 'rows' rows of a
+    wide csv file as a DataFrame, reading only the first line and the
+    end of the file.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+        # Reading further back until the whole last lines are in the chunk
+        back = 4096
+        while True:
+            f.seek(max(len(header), size - back))
+            chunk = f.read()
+            lines = chunk.rstrip(b"\n").split(b"\n")
+            if len(lines) > rows or size - back <= len(header):
+                break
+            back = back * 2
+
+    last = b"\n".join(lines[-rows:]) + b"\n" if chunk.strip() else b""
+    return pd.read_csv(io.BytesIO(header + last), index_col=0, parse_dates=True, float_precision="round_trip")
+
+def save_state(path, state):
+    """
+    Save state pickles 'state' to path, swapping the file in at once so
+    a run that stops half way leaves the old state.
+    """
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+def load_state(path):
+    """
+    Load state reads back what save_state stored at path.
+    """
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def read_dates(path):
+    """
+    Read dates returns the dates of a wide csv file in the order they
+    are in the file, parsing only the first column.
+    """
+    return pd.DatetimeIndex(pd.to_datetime(pd.read_csv(path, usecols=[0]).iloc[:, 0], format="ISO8601"))
+
+def replace_file(path, write):
+    """
+    Replace file calls write with a temporary path next to 'path' and
+    then moves it over 'path' in one step, so readers see either the old
+    or the new file and never a half written one.
+    """
+    folder, file = os.path.split(path)
+    tmp = os.path.join(folder, ".tmp.{}".format(file))
+    write(tmp)
+    os.replace(tmp, path)
+
+def append_rows(path, frame, fmt="csv", compression=None):
+    """
+    Append rows adds the rows of frame to the end of an output file.
+    Csv files are copied and appended to without parsing them, the
+    binary formats are read, extended and written again. Either way the
+    file is swapped in atomically.
+    """
+    if fmt == "csv":
+        def write(tmp):
+            shutil.copyfile(path, tmp)
+            with open(tmp, "a") as f:
+                frame.to_csv(f, header=False)
+    else:
+        old = load_frame(path)
+        old.index.name = "Dates"
+        def write(tmp):
+            write_frame(pd.concat([old, frame]), tmp[:-len(EXTENSIONS[fmt])], fmt, compression)
+    replace_file(path, write)
+
+def update_outputs(root, end, fields=FIELDS, names=NAMES, fmt="csv", compression=None, regress=True, **options):
+    """
+    Update outputs extends the wide files in 'root' up to 'end' instead
+    of rebuilding them. The last date and the tickers are read from the
+    existing files, only the days after that date are downloaded, and
+    their rows are appended. Csv files have to be in date order, as
+    external.py writes them, since only their ends are read. If nothing
+    was traded since the last date, like on a weekend or a holiday,
+    nothing is added. When 'regress' is set, the new rows of
+    every returns file are worked out with the horizons, kinds and nan
+    handling the -r run saved, from the last stored rows the longest
+    horizon needs (the whole file with 'ffill'), and appended to the
+    files that exist. If the last run saved indicators or rolling fits,
+    they carry on from their state and only their new rows are added.
+    The '_sm' fits over the whole history are not refitted, a note
+    counts the ones left as they were. 'join' and 'fill' align the new
+    days like get_panels, any other keyword argument is passed to
+    fetch_data. Returns the number of days added.
+    """
+    first = os.path.join(root, names[0] + EXTENSIONS[fmt])
+    if not os.path.exists(first):
+        raise Exception("Nothing to update, {} does not exist".format(first))
+    if fmt == "csv": # The newest row has to be the last one
+        for name in names:
+            dates = read_dates(os.path.join(root, name + EXTENSIONS[fmt]))
+            if not dates.is_monotonic_increasing or not dates.is_unique:
+                raise Exception("{} is not in date order, write it again without --update".format(name + EXTENSIONS[fmt]))
+    if fmt == "csv":
+        last = read_last_rows(first)
+    else:
+        last = load_frame(first).iloc[-1:]
+    tickers = [str(column) for column in last.columns]
+    if len(last) == 0:
+        raise Exception("Nothing to update, {} has no rows".format(first))
+
+    start = last.index[-1] + datetime.timedelta(days=1)
+    end = parse_date(end, "End date")
+    if start > end:
+        print("ALREADY UP TO DATE AT {}".format(last.index[-1].date()))
+        return 0
+
+    # Runs from before the settings were saved only wrote one day simple returns
+    settings = {"horizons": [1], "kinds": ["simple"], "nan": "keep"}
+    if os.path.exists(os.path.join(root, RETURNS_STATE)):
+        with open(os.path.join(root, RETURNS_STATE)) as f:
+            settings = json.load(f)
+    depth = max(settings["horizons"]) if regress else 1
+
+    join = options.pop("join", "outer")
+    fill = options.pop("fill", "none")
+    data_list = fetch_data(tickers, start, end, fields, **options)
+    if len(data_list) == 0: # Nothing traded since the last run
+        print("ALREADY UP TO DATE AT {}".format(last.index[-1].date()))
+        return 0
+    panel, gaps = align_panel(build_panel(data_list, fields), join=join, fill=fill)
+    rolling = None
+    if regress and os.path.exists(os.path.join(root, ROLLING_STATE)):
+        rolling = load_state(os.path.join(root, ROLLING_STATE))
+    added = 0
+    rows = dict()
+    for field, name in zip(fields, names):
+        path = os.path.join(root, name + EXTENSIONS[fmt])
+        if regress and settings["nan"] == "ffill": # The last price of a ticker can be any number of rows back
+            previous = load_frame(path)
+        elif fmt == "csv":
+            previous = read_last_rows(path, depth)
+        else:
+            previous = load_frame(path).iloc[-depth:]
+        new = panel[field].reindex(columns=previous.columns)
+        new = new[new.index > previous.index[-1]]
+        rows[field] = new
+        if len(new) == 0:
+            continue
+        append_rows(path, new, fmt, compression)
+        added = len(new)
+
+        if regress: # Returns only need the stored prices the longest horizon reaches back to
+            previous.index.name = new.index.name
+            results = panel_returns({field: pd.concat([previous, new])}, [field], settings["horizons"],
+                                    settings["kinds"], settings["nan"])
+            for (_, kind, horizon), returns in results.items():
+                returns_path = os.path.join(root, returns_name(name, kind, horizon) + EXTENSIONS[fmt])
+                if os.path.exists(returns_path):
+                    append_rows(returns_path, returns[returns.index > previous.index[-1]], fmt, compression)
+
+            if rolling is not None and field in rolling["models"]: # Rolling fits only add the new days to their sums
+                returns = results[(field, "simple", 1)]
+                returns = returns[returns.index > previous.index[-1]]
+                if len(rolling["regressors"]) == 0:
+                    benchmark = market_return(returns)["market"]
+                else:
+                    benchmark = returns.reindex(columns=rolling["regressors"][:1]).iloc[:, 0]
+                days = [rolling["models"][field].update(returns.loc[date], benchmark.loc[date]) for date in returns.index]
+                for k, stat in enumerate(["alpha", "beta", "corr"]):
+                    frame = pd.DataFrame([day[k] for day in days], index=returns.index)
+                    append_rows(os.path.join(root, "{}_rolling_{}{}".format(name, stat, EXTENSIONS[fmt])), frame, fmt, compression)
+
+    state = os.path.join(root, INDICATORS_STATE)
+    if added > 0 and os.path.exists(state): # Indicators only work out the new days
+        indicators = Indicators.load(state)
+        for name, frame in indicators.update(rows).items():
+            append_rows(os.path.join(root, "ta_{}{}".format(name, EXTENSIONS[fmt])), frame, fmt, compression)
+        indicators.save(state)
+    if added > 0 and rolling is not None:
+        save_state(os.path.join(root, ROLLING_STATE), rolling)
+
+    # Fits over the whole history can not be extended a few rows at a time
+    stale = list()
+    for field, name in zip(fields, names):
+        for file in sorted(os.listdir(root)):
+            if file == "{}_sm{}".format(name, EXTENSIONS[fmt]):
+                stale.append(file)
+            elif file.startswith("{}_rolling_".format(name)) and (rolling is None or field not in rolling["models"]):
+                stale.append(file)
+    if added > 0 and len(stale) > 0:
+        print("NOTE: {} REGRESSION FILES NOT UPDATED, RUN WITHOUT --update TO REFIT".format(len(stale)))
+
+    print("ADDED {} DAYS UP TO {}".format(added, end.date()))
+    return added
+
+def main(argv=None):
+    """
+    Main runs the command line program with the arguments in argv, or
+    sys.argv when argv is None.
+    """
 
     # Setting the command line options
     parser = argparse.ArgumentParser("stocks")
     parser.add_argument("-d", "--dow", help="Select the Dow Jones as your selected stocks", default=False, action="store_true")
     parser.add_argument("-p", "--sp", help="Select the S&P500 as your selected stocks", default=False, action="store_true")
     parser.add_argument("-e", "--end", help="End date in YYYY-MM-DD format", required=True)
-    parser.add_argument("-s", "--start", help="Start date in YYYY-MM-DD format", required=True)
+    parser.add_argument("-s", "--start", help="Start date in YYYY-MM-DD format, not needed with --update", default=None)
     parser.add_argument("-m", "--manual", help="Set the stocks you want to watch manually, tickers separated by commas, no whitespace.", default="")
-    parser.add_argument("-q", "--quick", help="Only get one datapoint instead of all of them.", default="")
+    parser.add_argument("-q", "--quick", help="Only get some datapoints instead of all of them, separated by commas, like 'Close,Adj Close'.", default="")
     parser.add_argument("-c", "--currency", help="Get currency tickers", default=False, action="store_true")
     parser.add_argument("-o", "--commodities", help="Get commodities tickers", default=False, action="store_true")
     parser.add_argument("-v", "--verbose", help="Each stock has its own directory", default=False, action="store_true")
     parser.add_argument("-r", "--regress", help="Return regression csv", default=False, action="store_true")
+    parser.add_argument("--regressors", help="Tickers to regress every other ticker on, separated by commas. Defaults to the equal weighted market", default="")
+    parser.add_argument("--horizons", help="With -r, also write returns over these numbers of days, separated by commas, like '5,21'", default="")
+    parser.add_argument("--log-returns", help="With -r, also write log returns", default=False, action="store_true")
+    parser.add_argument("--nan", help="With -r, how missing prices are handled in the returns", default="keep", choices=NANS)
+    parser.add_argument("--indicators", help="Also write moving averages, RSI, ATR, Bollinger bands, VWAP and OBV for every ticker", default=False, action="store_true")
+    parser.add_argument("--rolling", help="With -r, also write rolling alpha, beta and correlation against the first regressor over this many days", default=0, type=int)
+    parser.add_argument("--processes", help="Number of processes to split the tickers over, each downloading with --workers threads", default=1, type=int)
+    parser.add_argument("-w", "--workers", help="Number of tickers to download at the same time", default=1, type=int)
+    parser.add_argument("-t", "--timeout", help="Seconds to wait on a single ticker before giving up", default=30, type=float)
+    parser.add_argument("--join", help="Keep every trading day (outer) or only days all tickers traded (inner)", default="outer", choices=["outer", "inner"])
+    parser.add_argument("--fill", help="How to fill days a ticker did not trade", default="none", choices=["none", "ffill", "bfill"])
+    parser.add_argument("-f", "--format", help="File format of the output", default="csv", choices=list(EXTENSIONS))
+    parser.add_argument("--compression", help="Compression codec for parquet or feather output", default=None)
+    parser.add_argument("--stream", help="Write each ticker out as it arrives instead of keeping them all in memory", default=False, action="store_true")
+    parser.add_argument("--store", help="Also save the panel as a memory mapped store in this directory", default="")
+    parser.add_argument("--universe-cache", help="Directory to keep scraped index members in", default="")
+    parser.add_argument("--universe-ttl", help="Hours before scraped index members are checked again", default=24, type=float)
+    parser.add_argument("--snapshots", help="Directory to keep dated snapshots of index members in", default="")
+    parser.add_argument("--point-in-time", help="Use every ticker that was in the index between start and end, from the snapshots", default=False, action="store_true")
+    parser.add_argument("--retries", help="Times to try a failed ticker again", default=0, type=int)
+    parser.add_argument("--profile", help="Write stage timings, memory, download latency and file sizes to profile.json in the output directory", default=False, action="store_true")
+    parser.add_argument("--profile-python", help="With --profile, also run cProfile and save profile.prof", default=False, action="store_true")
+    parser.add_argument("--profile-memory", help="With --profile, also trace Python allocations of each stage", default=False, action="store_true")
+    parser.add_argument("--output", help="Directory to write the output to", default=".")
+    parser.add_argument("--combined", help="With -v, write all the fields of a ticker into one file", default=False, action="store_true")
+    parser.add_argument("--source", help="Download from yahoo, or replay a local output directory", default="yahoo", choices=["yahoo", "local"])
+    parser.add_argument("--local", help="Output directory the local source reads from, like 2020_FINAL", default="")
+    parser.add_argument("--record", help="Directory to save every download in so it can be replayed with the local source", default="")
+    parser.add_argument("--fallback", help="Output directory to read a ticker from when the source fails on it", default="")
+    parser.add_argument("--archive", help="Write every output file into this .tar.gz or .zip instead of loose files", default="")
+    parser.add_argument("--compact", help="Keep prices as float32, volume as integers and tickers as codes to save memory", default=False, action="store_true")
+    parser.add_argument("--update", help="Add the days after the last one in the existing output files, up to the end date", default=False, action="store_true")
+    parser.add_argument("--cache", help="Directory to keep downloaded data in, only missing dates get downloaded", default="")
+    parser.add_argument("--cache-size", help="Largest size of the cache in megabytes, 0 for no limit", default=0, type=float)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    profiler = Profiler(args.profile, args.profile_python, args.profile_memory)
 
-    # Sanitizing user inputted start date
-    try:
-        start = datetime.datetime.strptime(args.start, "%Y-%m-%d")
-    except:
-        raise Exception("Start date must be in YYYY-MM-DD format")
+    # Sanitizing user inputted dates
+    end = parse_date(args.end, "End date")
+    fields = FIELDS
+    names = NAMES
+    if args.quick != "": # Only the chosen fields are kept from the download onwards
+        fields = args.quick.split(",")
+        names = fields
+        for field in fields:
+            if field not in FIELDS:
+                raise Exception("Quick fields must be some of {}".format(", ".join(FIELDS)))
+    source = make_source(args.source, args.local, args.record, args.fallback)
 
-    # Sanitizing user inputted end date
-    try:
-        end = datetime.datetime.strptime(args.end, "%Y-%m-%d")
-    except:
-        raise Exception("End date must be in YYYY-MM-DD format")
+    if args.update: # Only adding the days after the last one already written
+        if args.archive != "":
+            raise Exception("An archive can not be updated, run --update on loose files")
+        if args.compact:
+            raise Exception("Compact output can not be appended to, run --update without --compact")
+        profiler.stage("update")
+        update_outputs(args.output, end, fields, names, args.format, args.compression, regress=args.regress,
+                       join=args.join, fill=args.fill, workers=args.workers, timeout=args.timeout, retries=args.retries,
+                       cache=args.cache, cache_size=args.cache_size, fetch=source, profiler=profiler)
+        if args.profile:
+            profiler.end_stage()
+            print(profiler.finish(os.path.join(args.output, "profile.json"), args.output))
+        return
+
+    if args.start is None:
+        raise Exception("Start date must be in YYYY-MM-DD format")
+    if args.indicators and args.stream:
+        raise Exception("Indicators need the whole panel, they can not be used with --stream")
+    if args.indicators and any(field not in fields for field in INPUTS):
+        raise Exception("Indicators need the {} fields, add them to --quick".format(", ".join(INPUTS)))
+    if args.processes > 1 and args.stream:
+        raise Exception("Streaming writes from one process, it can not be used with --processes")
+    if args.regress and args.stream:
+        raise Exception("Regressions need the whole panel, they can not be used with --stream")
+    if args.stream and (args.horizons != "" or args.log_returns or args.nan != "keep"):
+        raise Exception("Returns are not written with --stream, --horizons, --log-returns and --nan can not be used with it")
+    if args.compact and args.stream:
+        raise Exception("Streaming spools every value as float64, it can not be used with --compact")
+    start = parse_date(args.start, "Start date")
 
     # Making sure the tickers will not be empty
     if not args.dow and not args.sp and args.manual and args.commodities == "" and not args.currency:
         raise Exception("You need to select a market")
 
-    tickers = set()
-
-    # Adding all requested symbols to the tickers list
-    if args.dow:
-        tickers = tickers.union(set(get_Dow()))
-    if args.sp:
-        tickers = tickers.union(set(get_SP()))
-    if args.currency:
-        tickers = tickers.union(set(get_currency()))
-    if args.commodities:
-        tickers = tickers.union(set(get_commodities()))
+    # Scraping every requested index at the same time
+    profiler.stage("universe")
+    manual = list()
     if args.manual != "":
-        tickers = tickers.union(set(args.manual.split(",")))
-
-    # For each tag requested, get that data from yfinance as a DataFrame
-    data_list = list()
-    index = 0
-    for tag in tickers:
-        index = index + 1
-        try:
-            print("Working on : {}, {} OUT OF {}".format(tag, index, len(tickers)))
-            if args.quick == "": # If asking for all datapoints
-                data = pdr.get_data_yahoo(tag, start=start, end=end)
-                print(data)
-                data['Ticker'] = tag
-                data_list.append(data)
-            else: # If only want user selected datapoint
-                data = pdr.get_data_yahoo(tag, start=start, end=end)
-                data["Ticker"] = tag
-                data = data[[ args.quick, "Ticker"]]
-                data_list.append(data)
-        except: # Data returned by yfinance was None
-            print("DATA NOT FOUND, LIKELY A WEEKEND")
-            continue
+        manual = args.manual.split(",")
+    regressors = list()
+    if args.regressors != "": # Regressors need to be downloaded too
+        regressors = args.regressors.split(",")
+    tickers = get_universe(args.dow, args.sp, args.currency, args.commodities, manual + regressors,
+                           args.universe_cache, args.universe_ttl * 60 * 60, args.snapshots, args.point_in_time, start, end)
+    if args.source == "local" and len(tickers) == 0: # Replaying every ticker the directory has
+        tickers = LocalSource(args.local).tickers()
 
-    if args.verbose: # If verbose mode was selected with '-v' or '--verbose'
-        # Make a table with all the combined data
-        table = reduce(lambda x, acc: pd.concat([x, acc]), data_list, pd.DataFrame())
-        table = table.sort_index()
-        dates = list(set(table.index.values))
-
-        mode = dict()
-        highs = dict()
-        lows = dict()
-        opens = dict()
-        closes = dict()
-        volume = dict()
-        adj_close = dict()
-        for tag in tickers: # Filling each datapoint with values for each symbol
-            highs[tag] = table[table["Ticker"].str.contains(tag)]["High"].values
-            lows[tag] = table[table["Ticker"].str.contains(tag)]["Low"].values
-            opens[tag] = table[table["Ticker"].str.contains(tag)]["Open"].values
-            closes[tag] = table[table["Ticker"].str.contains(tag)]["Close"].values
-            adj_close[tag] = table[table["Ticker"].str.contains(tag)]["Adj Close"].values
-            volume[tag] = table[table["Ticker"].str.contains(tag)]["Volume"].values
-
-            if len(highs[tag]) in mode: # Making sure each symbol has the same number of rows
-                mode[len(highs[tag])] = mode[len(highs[tag])] + 1
-            else:
-                mode[len(highs[tag])] = 1
-
-        # Finding the mode number of rows
-        tmp = 0
-        m = 0
-        for i in mode:
-            if mode[i] > tmp and i != 0:
-                tmp = mode[i]
-                m = i
-
-        # Turning DataFrames into dicts 
-        dicts = [highs, lows, opens, closes, volume, adj_close]
-        for datapoint in dicts:
-            datapoint["Dates"] = dates
-            for tag in datapoint:
-                l = list()
-                for x in datapoint[tag]:
-                    l.append(x)
-                if len(l) == m:
-                    datapoint[tag] = l
-
-        # Deleting symbols with odd number of rows
-        tmp = dicts
-        deletes = list()
-        for i in dicts:
-            for j in list(i.keys()):
-                if len(i[j]) != m:
-                    del i[j]
-
-        # Adding date index
-        for i in dicts:
-            i["Dates"] = dates
-
-        # Writing to a csv
-        l = ["high", "low", "open", "close", "volume", "adj_close"]
-        i = 0
-        for datapoint in dicts:
-            for ticker in datapoint:
-                try:
-                    df = pd.DataFrame({ticker: datapoint[ticker]})
-                    df["Dates"] = dates
-                    df.set_index("Dates", inplace=True)
-                    df.sort_index()
-                    csv = df.to_csv()
-                    os.system("mkdir {}".format(ticker))
-                    f = open("{}/{}.csv".format(ticker, l[i]), 'w')
-                    f.write(csv)
-                    f.close()
-                except:
-                    continue
-            i = i + 1
-
-    elif args.quick == "": # If user only wanted all datapoints
-        # Getting one table with all the data
-        table = reduce(lambda x, acc: pd.concat([x, acc]), data_list, pd.DataFrame())
-        table = table.sort_index()
-        dates = list(set(table.index.values))
-
-        mode = dict()
-        highs = dict()
-        lows = dict()
-        opens = dict()
-        closes = dict()
-        volume = dict()
-        adj_close = dict()
-        for tag in tickers: # Filling each datapoint with values for each symbol
-            highs[tag] = table[table["Ticker"].str.contains(tag)]["High"].values
-            lows[tag] = table[table["Ticker"].str.contains(tag)]["Low"].values
-            opens[tag] = table[table["Ticker"].str.contains(tag)]["Open"].values
-            closes[tag] = table[table["Ticker"].str.contains(tag)]["Close"].values
-            adj_close[tag] = table[table["Ticker"].str.contains(tag)]["Adj Close"].values
-            volume[tag] = table[table["Ticker"].str.contains(tag)]["Volume"].values
-
-            if len(highs[tag]) in mode: # Making sure each symbol has the same number of rows
-                mode[len(highs[tag])] = mode[len(highs[tag])] + 1
-            else:
-                mode[len(highs[tag])] = 1
-
-        tmp = 0 
-        m = 0
-        for i in mode: # Finding mode number of rows
-            if mode[i] > tmp and i != 0:
-                tmp = mode[i]
-                m = i
-
-        dicts = [highs, lows, opens, closes, volume, adj_close]
-        for datapoint in dicts: # Turning DataFrames into dicts
-            datapoint["Dates"] = dates
-            for tag in datapoint:
-                l = list()
-                for x in datapoint[tag]:
-                    l.append(x)
-                if len(l) == m:
-                    datapoint[tag] = l
-
-        tmp = dicts
-        deletes = list()
-        for i in dicts: # Deleting symbols with odd number of rows
-            for j in list(i.keys()):
-                if len(i[j]) != m:
-                    del i[j]
-
-        for i in dicts: # Adding date as index
-            i["Dates"] = dates
-
-        # Creating the dataframes needed
-        highs_frame = pd.DataFrame(highs)
-        highs_frame.set_index("Dates", inplace=True)
-        highs_frame.sort_index()
-        lows_frame = pd.DataFrame(lows)
-        lows_frame.set_index("Dates", inplace=True)
-        lows_frame.sort_index()
-        opens_frame = pd.DataFrame(opens)
-        opens_frame.set_index("Dates", inplace=True)
-        opens_frame.sort_index()
-        closes_frame = pd.DataFrame(closes)
-        closes_frame.set_index("Dates", inplace=True)
-        closes_frame.sort_index()
-        volume_frame = pd.DataFrame(volume)
-        volume_frame.set_index("Dates", inplace=True)
-        volume_frame.sort_index()
-        adj_close_frame = pd.DataFrame(adj_close)
-        adj_close_frame.set_index("Dates", inplace=True)
-        adj_close_frame.sort_index()
-
-        frames = [highs_frame, lows_frame, opens_frame, closes_frame, volume_frame, adj_close_frame]
-        i = 0
-        for name in ["high", "low", "open", "close", "volume", "adj_close"]: # Write to csv
-            csv = frames[i].to_csv()
-            f = open("{}.csv".format(name), 'w')
-            f.write(csv)
-            f.close()
-            i = i + 1
-
-        i = 0
-        names = ["high", "low", "open", "close", "volume", "adj_close"]
-        if args.regress: # Creates regression csv's if user requested it with the '-r' option
-            for frame in frames:
-                returns = frame.pct_change()
-                csv = returns.to_csv()
-                f = open("{}_pct_change.csv".format(names[i]), 'w')
-                f.write(csv)
-                f.close()
-
-                line = " + ".join(frame.columns[1:])
-                model = sm.ols("{} ~ {}".format(frame.columns[0], line), data=frame)
-                model = returns.to_csv()
-                f = open("{}_sm.csv".format(names[i]), 'w')
-                f.write(csv)
-                f.close()
+    os.makedirs(args.output, exist_ok=True)
+    archive = None
+    if args.archive != "": # Every file goes into one archive as it is made
+        archive = ArchiveWriter(args.archive, args.output, args.workers)
+
+    if args.stream: # Writing each ticker out as soon as it arrives
+        profiler.stage("fetch")
+        fetch, ticker_cache = make_fetch(args.cache, args.cache_size, profiler, source)
+        writer = StreamWriter(tickers, start, end, fields, names, args.format, args.compression,
+                              verbose=args.verbose, join=args.join, fill=args.fill, root=args.output, combined=args.combined, archive=archive)
+        fetch_all(tickers, start, end, workers=args.workers, timeout=args.timeout, fetch=fetch, on_data=writer.add,
+                  retries=args.retries, fields=fields)
+        if ticker_cache is not None:
+            ticker_cache.save()
+            print(ticker_cache.summary())
+        profiler.stage("write")
+        gaps = writer.close()
+        for tag in gaps: # Reporting tickers that are missing trading days
+            print("GAPS IN {}: {} MISSING DAYS".format(tag, gaps[tag]))
+
+    else:
+        if args.processes > 1: # Every process fills its own tickers of a shared panel
+            profiler.stage("fetch")
+            panel, gaps = shard_panels(tickers, start, end, fields, args.processes, args.join, args.fill, args.workers,
+                                       args.timeout, args.retries, (args.source, args.local, args.record, args.fallback),
+                                       args.cache, args.cache_size, args.compact)
+        else:
+            panel, gaps = get_panels(tickers, start, end, fields, args.join, args.fill, args.workers, args.timeout,
+                                     args.retries, args.cache, args.cache_size, source, profiler, args.compact)
+        for tag in gaps: # Reporting tickers that are missing trading days
+            print("GAPS IN {}: {} MISSING DAYS".format(tag, gaps[tag]))
+        if args.compact: # Reporting what the smaller types saved
+            used, wide = panel_bytes(panel)
+            print("COMPACT PANEL: {:.1f} MB INSTEAD OF {:.1f} MB".format(used / 2 ** 20, wide / 2 ** 20))
+        frames = [panel[field] for field in fields]
+        if args.store != "": # Saving every field in one memory mapped array
+            profiler.stage("store")
+            save_panel(panel, args.store)
+
+        profiler.stage("write")
+
+        if args.verbose: # If verbose mode was selected with '-v' or '--verbose'
+            write_tickers(panel, fields, names, args.output, args.format, args.compression, args.combined, args.workers, archive)
 
+        elif args.quick == "": # If user only wanted all datapoints
+            i = 0
+            for name in names: # Write to file
+                write_frame(frames[i], os.path.join(args.output, name), args.format, args.compression, archive)
                 i = i + 1
-        
-    else: # User wants only one datapoint
-        # Getting one table with all the data
-        table = reduce(lambda x, acc: pd.concat([x, acc]), data_list, pd.DataFrame())
-        table = table.sort_index()
-        dates = list(set(table.index.values))
-
-        d = dict()
-        for tag in tickers: # Turning data into dict
-            d[tag] = table[table["Ticker"].str.contains(tag)].values
-
-        for x in d: # Adding dates
-            l = list()
-            for y in d[x]:
-                l.append(y[0])
-            d[x] = l
-        d["Dates"] = dates
-        
-        # Creating dataframe
-        df = pd.DataFrame(d)
-        df.set_index("Dates", inplace=True)
-        df.sort_index()
-
-        # Writing to csv
-        csv = df.to_csv()
-        f = open("{}.csv".format(args.quick), 'w')
-        f.write(csv)
-        f.close()
\ No newline at end of file
+
+            i = 0
+            if args.regress: # Creates regression files if user requested it with the '-r' option
+                profiler.stage("returns")
+                horizons = [1]
+                if args.horizons != "":
+                    horizons = sorted(set(horizons + [int(x) for x in args.horizons.split(",")]))
+                kinds = KINDS if args.log_returns else ["simple"]
+                results = panel_returns(panel, fields, horizons, kinds, args.nan, np.float32 if args.compact else np.float64)
+                write_returns(results, fields, names, args.output, args.format, args.compression, args.workers, archive)
+                if archive is None: # Saving how the returns were made for --update
+                    with open(os.path.join(args.output, RETURNS_STATE), "w") as f:
+                        json.dump({"horizons": horizons, "kinds": kinds, "nan": args.nan}, f)
+
+                profiler.stage("regress")
+                models = dict()
+                for field in fields:
+                    returns = results[(field, "simple", 1)]
+
+                    # Fitting every ticker on the regressors in one go
+                    if len(regressors) == 0:
+                        model = fit_returns(returns, market_return(returns))
+                    else:
+                        others = [tag for tag in returns.columns if tag not in regressors]
+                        model = fit_returns(returns[others], returns.reindex(columns=regressors))
+                    write_frame(model, os.path.join(args.output, "{}_sm".format(names[i])), args.format, args.compression, archive)
+
+                    if args.rolling > 0: # Rolling fits against the benchmark
+                        if len(regressors) == 0:
+                            benchmark = market_return(returns)["market"]
+                        else:
+                            benchmark = returns.reindex(columns=regressors[:1]).iloc[:, 0]
+                        rolled = rolling_beta(returns, benchmark, window=args.rolling)
+                        for stat, values in zip(["alpha", "beta", "corr"], rolled):
+                            write_frame(values, os.path.join(args.output, "{}_rolling_{}".format(names[i], stat)), args.format, args.compression, archive)
+
+                        # Running sums of the last window, for --update to carry on from
+                        models[field] = RollingBeta(returns.columns, window=args.rolling)
+                        for date in returns.index[-args.rolling:]:
+                            models[field].update(returns.loc[date], benchmark.loc[date])
+
+                    i = i + 1
+
+                if archive is None: # Saving the rolling fits for --update, or dropping ones an older run left
+                    if len(models) > 0:
+                        save_state(os.path.join(args.output, ROLLING_STATE), {"regressors": regressors, "models": models})
+                    elif os.path.exists(os.path.join(args.output, ROLLING_STATE)):
+                        os.remove(os.path.join(args.output, ROLLING_STATE))
+
+        else: # User wants only some datapoints
+            for frame, name in zip(frames, names):
+                write_frame(frame, os.path.join(args.output, name), args.format, args.compression, archive)
+
+        if args.indicators: # Every indicator for every ticker at once, saving the state for --update
+            profiler.stage("indicators")
+            indicators = Indicators()
+            for name, frame in indicators.update(panel).items():
+                if args.compact:
+                    frame = frame.astype(np.float32)
+                write_frame(frame, os.path.join(args.output, "ta_{}".format(name)), args.format, args.compression, archive)
+            if archive is None:
+                indicators.save(os.path.join(args.output, INDICATORS_STATE))
+
+    if archive is not None:
+        print("ARCHIVE WRITTEN TO {}".format(archive.close()))
+
+    if args.profile: # Reporting where the time went
+        profiler.end_stage()
+        print(profiler.finish(os.path.join(args.output, "profile.json"), args.output))
+
+if __name__=="__main__":
+    main()
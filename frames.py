@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import io
+import numpy as np
+import pandas as pd
+
+# Fields returned by yahoo finance and the file names they are written to
+FIELDS = ["High", "Low", "Open", "Close", "Volume", "Adj Close"]
+NAMES = ["high", "low", "open", "close", "volume", "adj_close"]
+
+# File extension used for each output format
+EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+def write_frame(frame, name, fmt="csv", compression=None, archive=None):
+    """
+    Write frame saves a wide DataFrame as name plus the extension of the
+    chosen format. Parquet and feather keep the date index and the
+    column types, so nothing has to be parsed again when loading, and
+    are compressed with zstd unless another codec is given. With an
+    archive.ArchiveWriter the file goes into the archive instead of
+    onto disk. Returns the path that was written.
+    """
+    path = name + EXTENSIONS[fmt]
+    target = path if archive is None else io.BytesIO()
+    if fmt == "csv":
+        frame.to_csv(target)
+    elif fmt == "parquet":
+        frame.to_parquet(target, compression=compression or "zstd")
+    elif fmt == "feather":
+        frame.reset_index().to_feather(target, compression=compression or "zstd")
+    else:
+        raise Exception("Format must be one of {}".format(", ".join(EXTENSIONS)))
+    if archive is not None:
+        archive.add(path, target.getvalue())
+
+    return path
+
+def load_frame(path):
+    """
+    Load frame reads back a file written by write_frame, picking the
+    reader from the file extension, and returns it with the dates as
+    a sorted DatetimeIndex.
+    """
+    if path.endswith(".parquet"):
+        frame = pd.read_parquet(path)
+    elif path.endswith(".feather"):
+        frame = pd.read_feather(path)
+        frame = frame.set_index(frame.columns[0])
+    else:
+        frame = pd.read_csv(path, index_col=0, parse_dates=True, float_precision="round_trip")
+
+    return frame.sort_index()
+
+def build_panel(data_list, fields=FIELDS):
+    """
+    Build panel turns the list of per ticker DataFrames returned by
+    fetch_all into one wide (date x ticker) DataFrame per field. All
+    the tickers are concatenated once and every field is pivoted in a
+    single unstack, so tickers are matched exactly instead of with a
+    substring search. Returns a dict of field name to DataFrame.
+    """
+    if len(data_list) == 0:
+        raise Exception("No data was found for any of the tickers")
+
+    table = pd.concat(data_list)
+    table = table.set_index("Ticker", append=True)[fields]
+    table = table[~table.index.duplicated(keep="last")]
+    wide = table.unstack("Ticker").sort_index()
+    wide.index.name = "Dates"
+
+    panel = dict()
+    for field in fields:
+        panel[field] = wide[field]
+        if isinstance(panel[field].columns, pd.CategoricalIndex): # Compact tickers are plain names again once they are columns
+            panel[field].columns = panel[field].columns.astype(str)
+        panel[field].columns.name = None
+
+    return panel
+
+def compact_column(values, field):
+    """
+    Compact column casts the values of one field, a Series or a
+    DataFrame, to the type --compact keeps it in: volume a nullable
+    int64 and everything else float32.
+    """
+    if field == "Volume":
+        return values.round().astype("Int64")
+
+    return values.astype(np.float32)
+
+def place_ticker(values, dates, column, data, fields=FIELDS):
+    """
+    Place ticker writes one download from fetch_all into column
+    'column' of a (field x date x ticker) array laid out on 'dates'. A
+    date that is there twice keeps its last row, like build_panel. Every
+    date of the download has to be on 'dates'. Returns the rows that
+    were written.
+    """
+    data = data[~data.index.duplicated(keep="last")]
+    rows = dates.get_indexer(data.index)
+    if (rows < 0).any():
+        raise Exception("{} has dates that are not on the calendar of the run".format(data["Ticker"].iloc[0]))
+    for i, field in enumerate(fields):
+        values[i, rows, column] = data[field].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    return rows
+
+def align_panel(panel, join="outer", fill="none"):
+    """
+    Align panel puts every ticker on one sorted master index of trading
+    days. With an 'outer' join the master index holds every day any
+    ticker traded, with an 'inner' join only the days all of them
+    traded. Missing values can be left empty ('none'), or filled
+    forwards ('ffill') or backwards ('bfill'). Tickers with no data at
+    all are dropped. Returns the aligned panel and a dict of ticker to
+    the number of trading days it was missing.
+    """
+    if join not in ["outer", "inner"]:
+        raise Exception("Join must be 'outer' or 'inner'")
+    if fill not in ["none", "ffill", "bfill"]:
+        raise Exception("Fill must be 'none', 'ffill' or 'bfill'")
+
+    # A ticker traded on a day if any of its fields has a value
+    present = None
+    for field in panel:
+        if present is None:
+            present = panel[field].notna()
+        else:
+            present = present | panel[field].notna()
+    present = present.loc[:, present.any()]
+
+    if join == "outer":
+        master = present.index[present.any(axis=1)]
+    else:
+        master = present.index[present.all(axis=1)]
+
+    missing = (~present.loc[present.any(axis=1)]).sum()
+    gaps = missing[missing > 0].to_dict()
+
+    for field in panel:
+        frame = panel[field].reindex(index=master, columns=present.columns)
+        if fill == "ffill":
+            frame = frame.ffill()
+        elif fill == "bfill":
+            frame = frame.bfill()
+        panel[field] = frame
+
+    return panel, gaps
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from frames import write_frame
+
+# Kinds of returns and ways of handling missing prices panel_returns knows
+KINDS = ["simple", "log"]
+NANS = ["keep", "ffill", "zero", "drop"]
+
+def stack_fields(panel, fields):
+    """
+    Stack fields puts the chosen fields of a panel into one float64
+    array of shape (field, date, ticker), on the dates and tickers of
+    the first field. Returns the array, the dates and the tickers.
+    """
+    first = panel[fields[0]]
+    values = np.stack([panel[field].reindex(index=first.index, columns=first.columns)
+                       .to_numpy(dtype=np.float64, na_value=np.nan) for field in fields])
+
+    return values, first.index, first.columns
+
+def forward_fill(values):
+    """
+    Forward fill carries the last value of every (field, ticker) down
+    the date axis over missing values, without leaving numpy.
+    """
+    rows = np.arange(values.shape[1])[None, :, None]
+    last = np.where(np.isnan(values), 0, rows)
+    np.maximum.accumulate(last, axis=1, out=last)
+
+    return np.take_along_axis(values, last, axis=1)
+
+def panel_returns(panel, fields=None, horizons=(1,), kinds=("simple",), nan="keep", dtype=np.float64):
+    """
+    Panel returns works out the returns of every field in the panel
+    over every horizon in days, all fields at once on the stacked
+    array. The price ratio of a horizon is made once and gives both the
+    simple return (ratio - 1, the same numbers as DataFrame.pct_change)
+    and the log return (log of the ratio). Missing prices are left
+    missing ('keep'), carried forward first ('ffill'), or the missing
+    returns after the first 'horizon' days are set to 0 ('zero'), and
+    with 'drop' the dates no ticker has a return on are left out.
+    Returns a dict of (field, kind, horizon) to a (date x ticker)
+    DataFrame of type 'dtype'.
+    """
+    if nan not in NANS:
+        raise Exception("Nan must be one of {}".format(", ".join(NANS)))
+    for kind in kinds:
+        if kind not in KINDS:
+            raise Exception("Kind must be one of {}".format(", ".join(KINDS)))
+    for horizon in horizons:
+        if horizon < 1:
+            raise Exception("Horizons must be at least one day")
+    if fields is None:
+        fields = list(panel)
+
+    values, dates, tickers = stack_fields(panel, fields)
+    if nan == "ffill":
+        values = forward_fill(values)
+
+    results = dict()
+    for horizon in horizons:
+        ratio = np.full(values.shape, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio[:, horizon:] = values[:, horizon:] / values[:, :-horizon]
+            for kind in kinds:
+                out = ratio - 1 if kind == "simple" else np.log(ratio)
+                if nan == "zero":
+                    out[:, horizon:][np.isnan(out[:, horizon:])] = 0
+                for i, field in enumerate(fields):
+                    frame = pd.DataFrame(out[i].astype(dtype, copy=False), index=dates, columns=tickers)
+                    if nan == "drop":
+                        frame = frame[~np.isnan(out[i]).all(axis=1)]
+                    results[(field, kind, horizon)] = frame
+
+    return results
+
+def returns_name(name, kind, horizon):
+    """
+    Returns name is the file name of one set of returns. One day simple
+    returns keep the '_pct_change' name they always had, the others are
+    named like 'close_log_5d'.
+    """
+    if kind == "simple" and horizon == 1:
+        return "{}_pct_change".format(name)
+
+    return "{}_{}_{}d".format(name, kind, horizon)
+
+def write_returns(results, fields, names, root=".", fmt="csv", compression=None, workers=4, archive=None):
+    """
+    Write returns writes every result of panel_returns under 'root' on
+    a pool of 'workers' threads, or one at a time into an archive so
+    its members keep the same order. Returns the paths written.
+    """
+    files = {(field, kind, horizon): returns_name(names[fields.index(field)], kind, horizon)
+             for field, kind, horizon in results}
+
+    def write(key):
+        return write_frame(results[key], os.path.join(root, files[key]), fmt, compression, archive)
+
+    if archive is not None:
+        workers = 1
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(write, sorted(files, key=lambda key: files[key])))
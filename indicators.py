@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from horizons import forward_fill
+
+# Fields the indicators are worked out from
+INPUTS = ["High", "Low", "Close", "Volume"]
+
+def _rolling(values, window, stat):
+    """
+    Rolling applies stat to every window of 'window' rows of a (date x
+    ticker) array through a strided view, so no window is copied. Rows
+    before the first full window, and windows with a missing value, are
+    NaN like DataFrame.rolling.
+    """
+    out = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        out[window - 1:] = stat(sliding_window_view(values, window, axis=0))
+
+    return out
+
+def _smooth(rows, alpha, state, min_periods):
+    """
+    Smooth runs an exponential average with weight 'alpha' down the
+    rows of a (date x ticker) array, every ticker at once. Missing
+    values are skipped, like ewm(adjust=False, ignore_na=True), and a
+    ticker's average is NaN until it has seen 'min_periods' values.
+    'state' is the (average, count) pair carried over from the rows
+    before, and is updated in place.
+    """
+    average, count = state
+    out = np.full(rows.shape, np.nan)
+    for t in range(len(rows)):
+        x = rows[t]
+        ok = ~np.isnan(x)
+        average[ok] = np.where(count[ok] == 0, x[ok], average[ok] + alpha * (x[ok] - average[ok]))
+        count[ok] = count[ok] + 1
+        out[t] = np.where(count >= min_periods, average, np.nan)
+
+    return out
+
+class Indicators:
+    """
+    Indicators works out technical indicators for every ticker of a
+    panel at once: simple and exponential moving averages of the close,
+    RSI and ATR with Wilder's smoothing, Bollinger bands (population
+    standard deviation, 'width' of them either side), a rolling volume
+    weighted average price of the typical price (high + low + close) / 3
+    and on balance volume. Give update the whole history the first
+    time, and after that only the new days. The last rows of the inputs
+    and the running averages are kept between calls, so a daily run only
+    works out the new rows. Differences are taken against the last close
+    a ticker had, so missing days do not break RSI, ATR or OBV.
+    """
+
+    def __init__(self, sma=(20, 50), ema=(12, 26), rsi=14, atr=14, bollinger=20, width=2.0, vwap=20):
+        self.sma = list(sma)
+        self.ema = list(ema)
+        self.rsi = rsi
+        self.atr = atr
+        self.bollinger = bollinger
+        self.width = width
+        self.vwap = vwap
+        self.keep = max(self.sma + [bollinger, vwap]) - 1
+        self.tickers = None
+        self.tail = None
+        self.state = dict()
+
+    def update(self, panel):
+        """
+        Update takes a panel holding at least High, Low, Close and
+        Volume for the days after the last update, and returns a dict of
+        indicator name (like 'sma_20' or 'rsi_14') to a (date x ticker)
+        DataFrame covering just those days. The tickers are fixed by
+        the first call.
+        """
+        for field in INPUTS:
+            if field not in panel:
+                raise Exception("Indicators need the {} fields".format(", ".join(INPUTS)))
+        dates = panel["Close"].index
+        if self.tickers is None:
+            self.tickers = panel["Close"].columns
+            empty = np.zeros((0, len(self.tickers)))
+            self.tail = {field: empty for field in INPUTS}
+            self.state["close"] = np.full(len(self.tickers), np.nan)
+            self.state["obv"] = np.zeros(len(self.tickers))
+            for name in ["ema_{}".format(span) for span in self.ema] + ["gain", "loss", "atr"]:
+                self.state[name] = (np.zeros(len(self.tickers)), np.zeros(len(self.tickers), dtype=np.int64))
+
+        # The new rows with the rows kept from before on top, for the windowed indicators
+        new = dict()
+        rows = dict()
+        for field in INPUTS:
+            new[field] = panel[field].reindex(index=dates, columns=self.tickers).to_numpy(dtype=np.float64, na_value=np.nan)
+            rows[field] = np.vstack([self.tail[field], new[field]])
+            self.tail[field] = rows[field][max(0, len(rows[field]) - self.keep):] if self.keep > 0 else rows[field][:0]
+        skip = len(rows["Close"]) - len(dates)
+        high, low, close, volume = new["High"], new["Low"], new["Close"], new["Volume"]
+
+        results = dict()
+        for window in self.sma:
+            results["sma_{}".format(window)] = _rolling(rows["Close"], window, lambda w: w.mean(axis=-1))[skip:]
+        for span in self.ema:
+            results["ema_{}".format(span)] = _smooth(close, 2 / (span + 1), self.state["ema_{}".format(span)], span)
+
+        mid = _rolling(rows["Close"], self.bollinger, lambda w: w.mean(axis=-1))[skip:]
+        spread = self.width * _rolling(rows["Close"], self.bollinger, lambda w: w.std(axis=-1))[skip:]
+        results["bollinger_upper_{}".format(self.bollinger)] = mid + spread
+        results["bollinger_lower_{}".format(self.bollinger)] = mid - spread
+
+        typical = (rows["High"] + rows["Low"] + rows["Close"]) / 3
+        traded = _rolling(typical * rows["Volume"], self.vwap, lambda w: w.sum(axis=-1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            results["vwap_{}".format(self.vwap)] = (traded / _rolling(rows["Volume"], self.vwap, lambda w: w.sum(axis=-1)))[skip:]
+
+        # The last close each ticker had before every new row
+        filled = forward_fill(np.vstack([self.state["close"][None], close])[None])[0]
+        previous = filled[:-1]
+        change = close - previous
+        self.state["close"] = filled[-1].copy()
+
+        gain = np.where(np.isnan(change), np.nan, np.maximum(change, 0))
+        loss = np.where(np.isnan(change), np.nan, np.maximum(-change, 0))
+        gain = _smooth(gain, 1 / self.rsi, self.state["gain"], self.rsi)
+        loss = _smooth(loss, 1 / self.rsi, self.state["loss"], self.rsi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            results["rsi_{}".format(self.rsi)] = np.where(loss == 0, 100.0, 100 - 100 / (1 + gain / loss))
+        results["rsi_{}".format(self.rsi)][np.isnan(gain) | np.isnan(loss)] = np.nan
+
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+        true_range[np.isnan(high - low)] = np.nan
+        results["atr_{}".format(self.atr)] = _smooth(true_range, 1 / self.atr, self.state["atr"], self.atr)
+
+        flow = np.where(np.isnan(change) | np.isnan(volume), 0, np.sign(change) * np.nan_to_num(volume))
+        obv = self.state["obv"] + np.cumsum(flow, axis=0)
+        if len(obv) > 0:
+            self.state["obv"] = obv[-1].copy()
+        obv[np.isnan(filled[1:])] = np.nan
+        results["obv"] = obv
+
+        return {name: pd.DataFrame(values, index=dates, columns=self.tickers) for name, values in results.items()}
+
+    def save(self, path):
+        """
+        Save pickles the indicators and their state to 'path', so the
+        next run can carry on with update.
+        """
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(self, f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load(path):
+        """
+        Load reads back indicators saved with save.
+        """
+        with open(path, "rb") as f:
+            return pickle.load(f)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from frames import EXTENSIONS, FIELDS, NAMES, load_frame
+
+# Hidden folder the parsed copies are kept in, next to the files they come from
+SIDECAR = ".sidecar"
+
+def signature(paths):
+    """
+    Signature is the modification time and size of every path, which
+    changes whenever any of the files is rewritten.
+    """
+    result = list()
+    for path in paths:
+        stat = os.stat(path)
+        result.append((path, stat.st_mtime_ns, stat.st_size))
+
+    return result
+
+def read_sidecar(path, key):
+    """
+    Read sidecar returns what was stored at path if it was stored for
+    the same key, otherwise None.
+    """
+    try:
+        with open(path, "rb") as f:
+            stored = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if stored["key"] != key:
+        return None
+
+    return stored["value"]
+
+def write_sidecar(path, key, value):
+    """
+    Write sidecar stores value at path under key. A folder that can not
+    be written to just means there is no sidecar.
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump({"key": key, "value": value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+
+def read_csv(path):
+    """
+    Read csv parses a file written by external.py with the types known
+    up front: the first column is an ISO date index and every other
+    column is float64, so pandas does not have to guess. The rows come
+    back in date order, like load_frame, since older runs wrote their
+    dates unsorted.
+    """
+    with open(path) as f:
+        header = f.readline().rstrip("\n").split(",")
+    dtypes = {column: np.float64 for column in header[1:]}
+    frame = pd.read_csv(path, index_col=0, dtype=dtypes, float_precision="round_trip")
+    frame.index = pd.to_datetime(frame.index, format="ISO8601")
+    frame.index.name = "Dates"
+
+    return frame.sort_index()
+
+def load_file(path, sidecar=True):
+    """
+    Load file reads one output file. Csv files are parsed by read_csv
+    and a pickled copy is kept in the sidecar folder, which is used
+    instead of the csv for as long as the csv's mtime and size stay the
+    same. Parquet and feather files are read directly.
+    """
+    if not path.endswith(".csv"):
+        return load_frame(path)
+    if not sidecar:
+        return read_csv(path)
+
+    folder, file = os.path.split(path)
+    cached = os.path.join(folder, SIDECAR, file + ".pkl")
+    key = signature([path])
+    frame = read_sidecar(cached, key)
+    if frame is None:
+        frame = read_csv(path)
+        write_sidecar(cached, key, frame)
+
+    return frame
+
+def find_file(folder, name):
+    """
+    Find file returns the path of name in folder in whichever output
+    format it was written, or None.
+    """
+    for extension in EXTENSIONS.values():
+        path = os.path.join(folder, name + extension)
+        if os.path.isfile(path):
+            return path
+
+    return None
+
+def ticker_folders(root):
+    """
+    Ticker folders lists the per ticker folders written by -v.
+    """
+    folders = list()
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and name != "Dates" and not name.startswith("."):
+            if find_file(path, "all") or any(find_file(path, file) for file in NAMES):
+                folders.append(name)
+
+    return folders
+
+def load_panel(root, fields=FIELDS, suffix="", sidecar=True):
+    """
+    Load panel reads an output directory of external.py back into a
+    dict of field name to (date x ticker) DataFrame. The wide files
+    ('close.csv') are used when they are there, otherwise the panel is
+    put back together from the per ticker folders ('AAPL/close.csv' or
+    'AAPL/all.csv'). With suffix '_pct_change' the returns files are
+    read instead.
+    """
+    names = [NAMES[FIELDS.index(field)] for field in fields]
+    wide = [find_file(root, name + suffix) for name in names]
+    if all(path is not None for path in wide):
+        return {field: load_file(path, sidecar) for field, path in zip(fields, wide)}
+    if suffix != "":
+        raise Exception("No {} files in {}".format(suffix, root))
+
+    # Putting the per ticker folders back together, as one sidecar for the whole folder
+    paths = dict()
+    for tag in ticker_folders(root):
+        combined = find_file(os.path.join(root, tag), "all")
+        for name in names:
+            path = find_file(os.path.join(root, tag), name) or combined
+            if path is not None:
+                paths[(tag, name)] = path
+    if len(paths) == 0:
+        raise Exception("No output files in {}".format(root))
+
+    cached = os.path.join(root, SIDECAR, "panel_{}.pkl".format("_".join(names)))
+    key = signature(sorted(set(paths.values())))
+    if sidecar:
+        panel = read_sidecar(cached, key)
+        if panel is not None:
+            return panel
+
+    panel = dict()
+    for field, name in zip(fields, names):
+        columns = dict()
+        for (tag, file_name), path in paths.items():
+            if file_name != name:
+                continue
+            frame = load_file(path, sidecar=False)
+            columns[tag] = frame[name] if name in frame.columns else frame.iloc[:, 0]
+        panel[field] = pd.DataFrame(columns).sort_index()
+        panel[field].index.name = "Dates"
+    if sidecar:
+        write_sidecar(cached, key, panel)
+
+    return panel
+
+def load_returns(root, fields=FIELDS, sidecar=True):
+    """
+    Load returns reads the '_pct_change' files of an output directory.
+    """
+    return load_panel(root, fields, "_pct_change", sidecar)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+
+class MembershipStore:
+    """
+    Membership store keeps dated snapshots of which tickers were in an
+    index, one json file per change under 'root/<index>/<date>.json'.
+    A new snapshot is only written when the members differ from the
+    last one, so the files double as a log of additions and removals
+    and can answer who was in the index on any day since recording
+    started.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def snapshots(self, name):
+        """
+        Snapshots returns every (date, tickers) pair recorded for an
+        index, oldest first.
+        """
+        folder = os.path.join(self.root, name)
+        if not os.path.isdir(folder):
+            return list()
+
+        result = list()
+        for file in sorted(os.listdir(folder)):
+            if file.endswith(".json"):
+                with open(os.path.join(folder, file)) as f:
+                    result.append((datetime.date.fromisoformat(file[:-5]), json.load(f)))
+
+        return result
+
+    def record(self, name, tickers, date=None):
+        """
+        Record compares tickers with the last snapshot of the index and
+        saves a new snapshot dated 'date' (today by default) if they
+        differ. Returns the added, removed and unchanged tickers.
+        """
+        if date is None:
+            date = datetime.date.today()
+        tickers = sorted(set(tickers))
+
+        snapshots = self.snapshots(name)
+        previous = set() if len(snapshots) == 0 else set(snapshots[-1][1])
+        added = sorted(set(tickers) - previous)
+        removed = sorted(previous - set(tickers))
+        unchanged = sorted(previous & set(tickers))
+
+        if len(added) > 0 or len(removed) > 0:
+            folder = os.path.join(self.root, name)
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, "{}.json".format(date.isoformat())), "w") as f:
+                json.dump(tickers, f)
+
+        return added, removed, unchanged
+
+    def as_of(self, name, date):
+        """
+        As of returns the members of the index on 'date', or None if
+        nothing was recorded that early.
+        """
+        members = None
+        for day, tickers in self.snapshots(name):
+            if day > date:
+                break
+            members = tickers
+
+        return members
+
+    def between(self, name, start, end):
+        """
+        Between returns every ticker that was a member at any point from
+        start to end, so a historical window also keeps the tickers that
+        have since left the index. Returns None if nothing was recorded
+        by 'end'.
+        """
+        members = None
+        for day, tickers in self.snapshots(name):
+            if day > end:
+                break
+            if day <= start or members is None:
+                members = set(tickers)
+            else:
+                members = members.union(tickers)
+
+        return None if members is None else sorted(members)
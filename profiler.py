@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+# Upper edges in seconds of the download latency histogram buckets
+BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 30, float("inf")]
+
+def peak_rss():
+    """
+    Peak rss returns the most memory the process has held so far, in
+    bytes. Linux reports it in kilobytes and macOS in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Profiler:
+    """
+    Profiler records how long each stage of a run takes and how high
+    the memory of the process had got by the end of it, how long every
+    download attempt took and whether it worked, and how big each
+    output file is. Stages run one after the other: calling stage()
+    ends the one before. When 'enabled' is False nothing is reported
+    and the cost is a couple of clock reads per stage. 'python_profile'
+    runs cProfile over the whole run and 'trace_memory' adds the peak
+    Python allocations of each stage through tracemalloc. The operating
+    system only reports the peak memory of the whole run so far, so
+    that is what 'peak_rss_so_far' is; only 'peak_python' is the peak
+    of the stage itself.
+    """
+
+    def __init__(self, enabled=False, python_profile=False, trace_memory=False):
+        self.enabled = enabled
+        self.began = time.time()
+        self.stages = list()
+        self.current = None
+        self.fetches = list()
+        self.files = dict()
+        self.lock = threading.Lock()
+
+        self.python_profile = None
+        if enabled and python_profile:
+            self.python_profile = cProfile.Profile()
+            self.python_profile.enable()
+        self.trace_memory = enabled and trace_memory
+        if self.trace_memory:
+            tracemalloc.start()
+
+    def stage(self, name):
+        """
+        Stage ends the running stage, if any, and starts timing 'name'.
+        """
+        self.end_stage()
+        self.current = {"stage": name, "begin": time.perf_counter()}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+    def end_stage(self):
+        """
+        End stage stores the wall time of the running stage, the peak
+        memory of the run so far and, when tracing, the peak Python
+        allocations of the stage itself.
+        """
+        if self.current is None:
+            return
+        entry = {
+            "stage": self.current["stage"],
+            "seconds": time.perf_counter() - self.current["begin"],
+            "peak_rss_so_far": peak_rss(),
+        }
+        if self.trace_memory:
+            entry["peak_python"] = tracemalloc.get_traced_memory()[1]
+        self.stages.append(entry)
+        self.current = None
+
+    def timed_fetch(self, fetch):
+        """
+        Timed fetch wraps a fetch function like external.fetch_ticker so
+        every call, including retries and failures, is recorded.
+        """
+        if not self.enabled:
+            return fetch
+
+        def wrapper(tag, start, end, timeout=30):
+            begin = time.perf_counter()
+            try:
+                data = fetch(tag, start, end, timeout)
+            except Exception:
+                self.record_fetch(tag, time.perf_counter() - begin, False)
+                raise
+            self.record_fetch(tag, time.perf_counter() - begin, True)
+            return data
+
+        return wrapper
+
+    def record_fetch(self, tag, seconds, ok):
+        """
+        Record fetch stores one download attempt.
+        """
+        with self.lock:
+            self.fetches.append({"ticker": tag, "seconds": seconds, "ok": ok})
+
+    def record_outputs(self, root):
+        """
+        Record outputs walks 'root' and stores the size of every file
+        written since the profiler was made.
+        """
+        for folder, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for file in files:
+                path = os.path.join(folder, file)
+                if os.path.getmtime(path) >= self.began:
+                    self.files[os.path.relpath(path, root)] = os.path.getsize(path)
+
+    def histogram(self):
+        """
+        Histogram counts the download attempts in each latency bucket.
+        """
+        counts = [0] * len(BUCKETS)
+        for fetch in self.fetches:
+            for i, edge in enumerate(BUCKETS):
+                if fetch["seconds"] <= edge:
+                    counts[i] = counts[i] + 1
+                    break
+
+        return {"<={}s".format(edge): count for edge, count in zip(BUCKETS, counts)}
+
+    def report(self):
+        """
+        Report returns everything recorded as a dict ready for json.
+        """
+        self.end_stage()
+        attempts = dict()
+        for fetch in self.fetches:
+            attempts[fetch["ticker"]] = attempts.get(fetch["ticker"], 0) + 1
+
+        return {
+            "stages": self.stages,
+            "peak_rss": peak_rss(),
+            "fetch": {
+                "attempts": len(self.fetches),
+                "failures": sum(1 for fetch in self.fetches if not fetch["ok"]),
+                "retried": sorted(tag for tag in attempts if attempts[tag] > 1),
+                "seconds": sum(fetch["seconds"] for fetch in self.fetches),
+                "histogram": self.histogram(),
+            },
+            "files": self.files,
+            "bytes_written": sum(self.files.values()),
+        }
+
+    def finish(self, path="profile.json", root=None):
+        """
+        Finish writes the json report to 'path', plus 'profile.prof'
+        next to it when cProfile was on, and returns a short readable
+        summary. With 'root' the files written there, 'profile.prof'
+        included, are recorded first.
+        """
+        if not self.enabled:
+            return ""
+
+        prof = os.path.join(os.path.dirname(path), "profile.prof")
+        if self.python_profile is not None:
+            self.python_profile.disable()
+            self.python_profile.dump_stats(prof)
+        if root is not None:
+            self.record_outputs(root)
+        report = self.report()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        lines = ["PROFILE ({})".format(path)]
+        for stage in report["stages"]:
+            line = "  {:<10} {:>9.3f}s  peak rss so far {:>8.1f} MB".format(
+                stage["stage"], stage["seconds"], stage["peak_rss_so_far"] / 2 ** 20)
+            if "peak_python" in stage:
+                line = line + "  stage python peak {:>8.1f} MB".format(stage["peak_python"] / 2 ** 20)
+            lines.append(line)
+        fetch = report["fetch"]
+        lines.append("  {} download attempts, {} failed, {} tickers retried".format(
+            fetch["attempts"], fetch["failures"], len(fetch["retried"])))
+        lines.append("  {} files, {:.1f} MB written".format(len(report["files"]), report["bytes_written"] / 2 ** 20))
+
+        if self.python_profile is not None:
+            out = io.StringIO()
+            pstats.Stats(self.python_profile, stream=out).sort_stats("cumulative").print_stats(15)
+            lines.append(out.getvalue())
+
+        return "\n".join(lines)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+from collections import deque
+import numpy as np
+import pandas as pd
+
+def fit_returns(returns, regressors):
+    """
+    Fit returns regresses the returns of every ticker in 'returns' on
+    the regressor columns in 'regressors' (both DataFrames on the same
+    date index) plus an intercept. Every ticker is fitted at once: the
+    normal equations for all tickers are built with one einsum and
+    solved in one batched call, using only the days on which that
+    ticker and all the regressors have a value. Returns a DataFrame with
+    one row per ticker holding the coefficients, their t-stats, the R²
+    and the number of days used.
+    """
+    regressors = regressors.reindex(returns.index)
+    X = np.column_stack([np.ones(len(returns)), regressors.to_numpy(dtype=np.float64)])
+    Y = returns.to_numpy(dtype=np.float64)
+
+    # Weight of 1 where the ticker and every regressor has a finite value, 0 elsewhere
+    W = (np.isfinite(Y) & np.isfinite(X).all(axis=1)[:, None]).astype(np.float64)
+    X = np.where(np.isfinite(X), X, 0)
+    Y = np.where(np.isfinite(Y), Y, 0)
+    n = W.sum(axis=0)
+    k = X.shape[1]
+
+    XtX = np.einsum("ti,tk,tj->jik", X, X, W)
+    XtY = np.einsum("ti,tj->ji", X, W * Y)
+
+    # Tickers without enough days to fit are left as NaN
+    ok = n > k
+    beta = np.full((Y.shape[1], k), np.nan)
+    tstat = np.full((Y.shape[1], k), np.nan)
+    r2 = np.full(Y.shape[1], np.nan)
+    if ok.any():
+        inv = np.linalg.pinv(XtX[ok])
+        beta[ok] = np.einsum("jik,jk->ji", inv, XtY[ok])
+
+        resid = W[:, ok] * (Y[:, ok] - X @ beta[ok].T)
+        ssr = (resid ** 2).sum(axis=0)
+        mean = (W[:, ok] * Y[:, ok]).sum(axis=0) / n[ok]
+        sst = (W[:, ok] * (Y[:, ok] - mean) ** 2).sum(axis=0)
+        sigma2 = ssr / (n[ok] - k)
+        se = np.sqrt(np.einsum("jii->ji", inv) * sigma2[:, None])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tstat[ok] = beta[ok] / se
+            r2[ok] = 1 - ssr / sst
+
+    names = ["alpha"] + ["beta_{}".format(column) for column in regressors.columns]
+    result = pd.DataFrame(beta, index=returns.columns.rename("Ticker"), columns=names)
+    for i, name in enumerate(names):
+        result["t_{}".format(name)] = tstat[:, i]
+    result["r2"] = r2
+    result["nobs"] = n.astype(np.int64)
+
+    return result
+
+def market_return(returns):
+    """
+    Market return is the equal weighted average return of all tickers
+    on each day, used as the regressor when none are chosen.
+    """
+    return returns.mean(axis=1).to_frame("market")
+
+def _window_stats(sums, n):
+    """
+    Window stats turns window sums (x, y, xx, yy, xy) and counts into
+    the rolling alpha, beta and correlation of y on x.
+    """
+    sx, sy, sxx, syy, sxy = sums
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cxy = sxy - sx * sy / n
+        cxx = sxx - sx * sx / n
+        cyy = syy - sy * sy / n
+        beta = cxy / cxx
+        alpha = (sy - beta * sx) / n
+        corr = cxy / np.sqrt(cxx * cyy)
+
+    return alpha, beta, corr
+
+def rolling_beta(returns, benchmark, window=60, min_periods=None):
+    """
+    Rolling beta computes the rolling alpha, beta and correlation of
+    every ticker in 'returns' against the 'benchmark' Series over the
+    last 'window' days. Running sums are built once with cumsum and each
+    window is the difference of two of them, so every day costs the same
+    no matter how long the window is. Days where either side is missing
+    are left out of that ticker's window. Returns three DataFrames.
+    """
+    if min_periods is None:
+        min_periods = window
+
+    x = benchmark.reindex(returns.index).to_numpy(dtype=np.float64)[:, None]
+    y = returns.to_numpy(dtype=np.float64)
+    w = (np.isfinite(x) & np.isfinite(y)).astype(np.float64)
+    x = np.where(w > 0, x, 0)
+    y = np.where(w > 0, y, 0)
+
+    # Running sums with a row of zeros on top so window t is cum[t + 1] - cum[t + 1 - window]
+    terms = [w, x, y, x * x, y * y, x * y]
+    sums = list()
+    for term in terms:
+        cum = np.vstack([np.zeros((1, y.shape[1])), np.cumsum(term, axis=0)])
+        lag = np.vstack([np.zeros((window, y.shape[1])), cum[:-window]])[:len(cum)]
+        sums.append((cum - lag)[1:])
+
+    n = sums[0]
+    alpha, beta, corr = _window_stats(sums[1:], n)
+    short = n < max(min_periods, 2)
+    frames = list()
+    for values in [alpha, beta, corr]:
+        values[short] = np.nan
+        frames.append(pd.DataFrame(values, index=returns.index, columns=returns.columns))
+
+    return frames[0], frames[1], frames[2]
+
+class RollingBeta:
+    """
+    Rolling beta keeps the running sums of the last 'window' days so a
+    new day of returns can be added in O(tickers), without refitting
+    any window. Seed it with the tail of the history through update and
+    it will agree with rolling_beta from then on.
+    """
+
+    def __init__(self, tickers, window=60, min_periods=None):
+        self.tickers = pd.Index(tickers)
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self.rows = deque()
+        self.sums = np.zeros((6, len(self.tickers)))
+
+    def update(self, returns, benchmark):
+        """
+        Update adds one day, given as a Series of ticker returns and the
+        benchmark return, drops the day that fell out of the window and
+        returns the new alpha, beta and correlation as three Series.
+        """
+        y = returns.reindex(self.tickers).to_numpy(dtype=np.float64)
+        x = np.full(len(y), np.nan if benchmark is None else float(benchmark))
+        w = (np.isfinite(x) & np.isfinite(y)).astype(np.float64)
+        x = np.where(w > 0, x, 0)
+        y = np.where(w > 0, y, 0)
+
+        row = np.stack([w, x, y, x * x, y * y, x * y])
+        self.sums = self.sums + row
+        self.rows.append(row)
+        if len(self.rows) > self.window:
+            self.sums = self.sums - self.rows.popleft()
+
+        alpha, beta, corr = _window_stats(self.sums[1:], self.sums[0])
+        short = self.sums[0] < max(self.min_periods, 2)
+        result = list()
+        for values in [alpha, beta, corr]:
+            values[short] = np.nan
+            result.append(pd.Series(values, index=self.tickers))
+
+        return result[0], result[1], result[2]
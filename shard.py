@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import traceback
+import numpy as np
+import pandas as pd
+from multiprocessing import Pipe, Process, resource_tracker, shared_memory
+from frames import FIELDS, align_panel, compact_column, place_ticker
+
+def attach(name, shape):
+    """
+    Attach opens the shared panel made by shard_panels in a worker and
+    returns the memory and a float64 array of 'shape' on top of it. The
+    parent removes the memory once every worker is done.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(memory._name, "shared_memory") # Only the parent that made the memory removes it
+    return memory, np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+
+def run_shard(conn, tickers, start, end, fields, workers=1, timeout=30, retries=0,
+              source=("yahoo", "", "", ""), cache="", cache_size=0):
+    """
+    Run shard is the worker process of shard_panels, talking to the
+    parent over 'conn'. It downloads its tickers with a pool of
+    'workers' threads and keeps them, then sends the dates it got and
+    whether each field only held integers. The parent answers with the
+    shared panel, the calendar of the whole run and the column its
+    tickers start at, and every download is written straight into its
+    own column, so no data has to be sent back. Last it sends the
+    tickers that had data and the cache index entries and counters of
+    its tickers, for the parent to merge. 'source' holds the arguments
+    of external.make_source. A failure is sent back as its traceback.
+    """
+    from external import fetch_all, make_fetch, make_source
+    try:
+        fetch, ticker_cache = make_fetch(cache, cache_size, None, make_source(*source))
+        data_list = fetch_all(tickers, start, end, workers=workers, timeout=timeout, fetch=fetch, retries=retries,
+                              fields=fields)
+        dates = pd.DatetimeIndex([])
+        if len(data_list) > 0:
+            dates = data_list[0].index.append([data.index for data in data_list[1:]]).unique()
+        integer = [all(pd.api.types.is_integer_dtype(data[field].dtype) for data in data_list) for field in fields]
+        conn.send(("dates", (dates, integer)))
+
+        name, shape, calendar, offset = conn.recv()
+        columns = {tag: offset + j for j, tag in enumerate(tickers)}
+        memory, values = attach(name, shape)
+        try:
+            for data in data_list:
+                place_ticker(values, calendar, columns[data["Ticker"].iloc[0]], data, fields)
+        finally:
+            del values
+            memory.close()
+
+        seen = [data["Ticker"].iloc[0] for data in data_list]
+        if ticker_cache is None:
+            conn.send(("done", (seen, dict(), dict())))
+        else:
+            conn.send(("done", (seen, {tag: ticker_cache.index[tag] for tag in tickers if tag in ticker_cache.index},
+                                ticker_cache.stats)))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+def receive(conn):
+    """
+    Receive reads the next message of a shard, raising if it failed.
+    """
+    try:
+        kind, value = conn.recv()
+    except EOFError:
+        raise Exception("A shard process stopped without answering")
+    if kind == "error":
+        raise Exception("A shard failed:\n{}".format(value))
+
+    return value
+
+def shard_panels(tickers, start, end, fields=None, processes=2, join="outer", fill="none", workers=1, timeout=30,
+                 retries=0, source=("yahoo", "", "", ""), cache="", cache_size=0, compact=False):
+    """
+    Shard panels is get_panels spread over 'processes' worker
+    processes, and gives the same panel. The sorted tickers are cut
+    into one contiguous shard per process. Every worker downloads its
+    shard and sends back only the dates it got, the parent makes the
+    calendar from all of them and a (field, date, ticker) panel of
+    NaN's in shared memory, and every worker fills in its own columns,
+    so no prices are pickled and no locks are needed. The parent then
+    builds the panel like build_panel, where a field that only held
+    integers with no gaps stays int64, and aligns it like get_panels
+    does. 'source' holds the arguments of external.make_source, since a
+    source object can not be handed to another process. Returns the
+    panel and the gaps.
+    """
+    from cache import TickerCache
+    from external import parse_date
+    if fields is None:
+        fields = FIELDS
+    tickers = sorted(tickers)
+    if len(tickers) == 0:
+        raise Exception("No data was found for any of the tickers")
+    start = parse_date(start, "Start date")
+    end = parse_date(end, "End date")
+    size = -(-len(tickers) // max(1, processes))
+    offsets = list(range(0, len(tickers), size))
+
+    conns = list()
+    children = list()
+    memory = None
+    values = None
+    try:
+        for lo in offsets:
+            conn, child = Pipe()
+            process = Process(target=run_shard, args=(child, tickers[lo:lo + size], start, end, fields, workers, timeout,
+                                                      retries, source, cache, cache_size))
+            process.start()
+            child.close()
+            conns.append(conn)
+            children.append(process)
+
+        # The calendar is every date any shard got, like the index build_panel unstacks onto
+        answers = [receive(conn) for conn in conns]
+        calendar = pd.DatetimeIndex([], name="Dates")
+        for dates, _ in answers:
+            calendar = calendar.union(dates)
+        calendar = calendar.rename("Dates")
+        integer = np.all([flags for _, flags in answers], axis=0)
+
+        shape = (len(fields), len(calendar), len(tickers))
+        memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+        values = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        values[:] = np.nan
+        for conn, lo in zip(conns, offsets):
+            conn.send((memory.name, shape, calendar, lo))
+        results = [receive(conn) for conn in conns]
+        seen = [tag for tags, _, _ in results for tag in tags]
+        cols = [tickers.index(tag) for tag in seen]
+        panel = dict()
+        for i, field in enumerate(fields):
+            column = values[i][:, cols]
+            panel[field] = pd.DataFrame(column, index=calendar, columns=seen)
+            if integer[i] and not np.isnan(column).any():
+                panel[field] = panel[field].astype(np.int64)
+    except Exception:
+        for process in children: # The other shards may still be waiting to be answered
+            process.terminate()
+        raise
+    finally:
+        for process in children:
+            process.join()
+        if memory is not None:
+            values = None # The memory can only be closed once nothing points into it
+            memory.close()
+            memory.unlink()
+
+    if cache != "": # Merging what every worker added to the cache into one index
+        ticker_cache = TickerCache(cache, None, max_bytes=int(cache_size * 1024 * 1024))
+        for _, index, stats in results:
+            ticker_cache.index.update(index)
+            for key in stats:
+                ticker_cache.stats[key] = ticker_cache.stats[key] + stats[key]
+        ticker_cache.save()
+        print(ticker_cache.summary())
+
+    if len(seen) == 0:
+        raise Exception("No data was found for any of the tickers")
+    panel, gaps = align_panel(panel, join=join, fill=fill)
+    if compact: # The same types compact_frame gives
+        for field in panel:
+            panel[field] = compact_column(panel[field], field)
+
+    return panel, gaps
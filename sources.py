@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import abc
+import os
+import threading
+import pandas as pd
+from frames import load_frame
+
+def file_field(name):
+    """
+    File field turns an output file name like 'adj_close' or
+    'Adj Close' back into the yahoo field name 'Adj Close'.
+    """
+    return name.replace("_", " ").title()
+
+class DataSource(abc.ABC):
+    """
+    Data source is what the pipeline downloads from. A source only has
+    to provide fetch. Sources can be wrapped in each other, and their
+    fetch passed to fetch_all, which only needs a callable with the
+    same arguments.
+    """
+
+    @abc.abstractmethod
+    def fetch(self, tag, start, end, timeout=30):
+        """
+        Fetch returns the data of 'tag' from start to end as a DataFrame
+        with one column per field on a DatetimeIndex and a 'Ticker'
+        column, giving up after 'timeout' seconds, or raises if there is
+        no data.
+        """
+
+class YahooSource(DataSource):
+    """
+    Yahoo source downloads from yahoo finance with the daily reader of
+    pandas_datareader.
+    """
+
+    def fetch(self, tag, start, end, timeout=30):
+        from pandas_datareader.yahoo.daily import YahooDailyReader
+        reader = YahooDailyReader(tag, start=start, end=end)
+        reader.timeout = timeout # The reader takes no timeout argument, but every request it makes uses this
+        try:
+            data = reader.read()
+        finally:
+            reader.close()
+        data["Ticker"] = tag
+        return data
+
+class LocalSource(DataSource):
+    """
+    Local source replays data from an output directory of external.py,
+    like '2020_FINAL/'. A ticker is read from its own folder, either one
+    file per field ('AAPL/close.csv') or the combined 'AAPL/all.csv',
+    and otherwise from the wide field files in the root ('close.csv').
+    Wide files are read once and kept for the other tickers.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.wide = None
+        self.lock = threading.Lock()
+
+    def tickers(self):
+        """
+        Tickers lists every ticker the directory has data for.
+        """
+        found = set()
+        for name in os.listdir(self.root):
+            if os.path.isdir(os.path.join(self.root, name)) and name != "Dates" and not name.startswith("."):
+                found.add(name)
+        for frame in self.wide_files().values():
+            found = found.union(str(column) for column in frame.columns)
+
+        return sorted(found)
+
+    def wide_files(self):
+        """
+        Wide files loads the wide field files in the root, skipping the
+        pct_change and regression outputs.
+        """
+        with self.lock:
+            if self.wide is None:
+                self.wide = dict()
+                for file in sorted(os.listdir(self.root)):
+                    path = os.path.join(self.root, file)
+                    name, extension = os.path.splitext(file)
+                    if os.path.isfile(path) and extension in [".csv", ".parquet", ".feather"] and "_" not in name.replace("adj_close", ""):
+                        field = file_field(name)
+                        if field not in self.wide:
+                            self.wide[field] = load_frame(path)
+
+            return self.wide
+
+    def fetch(self, tag, start, end, timeout=30):
+        folder = os.path.join(self.root, tag)
+        columns = dict()
+        if os.path.isdir(folder):
+            for file in sorted(os.listdir(folder)):
+                frame = load_frame(os.path.join(folder, file))
+                name = os.path.splitext(file)[0]
+                if name == "all":
+                    for column in frame.columns:
+                        columns[file_field(column)] = frame[column]
+                else:
+                    columns[file_field(name)] = frame.iloc[:, 0]
+        else:
+            for field, frame in self.wide_files().items():
+                if tag in frame.columns:
+                    columns[field] = frame[tag]
+
+        if len(columns) == 0:
+            raise Exception("No local data for {}".format(tag))
+        data = pd.DataFrame(columns).sort_index()
+        data = data.loc[pd.Timestamp(start):pd.Timestamp(end)].dropna(how="all")
+        if len(data) == 0:
+            raise Exception("No local data for {} between {} and {}".format(tag, start, end))
+        data.index.name = "Date"
+        data["Ticker"] = tag
+
+        return data
+
+class RecordingSource(DataSource):
+    """
+    Recording source passes every fetch on to another source and saves
+    what came back into 'root', in the combined per ticker layout
+    ('AAPL/all.csv'), merged with anything recorded before. A
+    LocalSource on the same root replays it.
+    """
+
+    def __init__(self, source, root):
+        self.source = source
+        self.root = root
+
+    def fetch(self, tag, start, end, timeout=30):
+        data = self.source.fetch(tag, start, end, timeout)
+
+        folder = os.path.join(self.root, tag)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, "all.csv")
+        frame = data.drop(columns="Ticker")
+        frame.columns = [column.lower().replace(" ", "_") for column in frame.columns]
+        if os.path.exists(path):
+            frame = pd.concat([load_frame(path), frame])
+            frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+        frame.index.name = "Dates"
+        frame.to_csv(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+        return data
+
+class FallbackSource(DataSource):
+    """
+    Fallback source tries the primary source and, if it fails or times
+    out, answers from the fallback source instead.
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def fetch(self, tag, start, end, timeout=30):
+        try:
+            return self.primary.fetch(tag, start, end, timeout)
+        except Exception:
+            print("USING LOCAL DATA FOR {}".format(tag))
+            return self.fallback.fetch(tag, start, end, timeout)
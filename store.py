@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+def save_panel(panel, path):
+    """
+    Save panel writes a dict of aligned wide DataFrames, as built by
+    external.align_panel, into the directory 'path'. The values go into
+    one contiguous float64 array of shape (field, date, ticker) saved
+    as 'panel.npy', and the field, date and ticker labels go into a
+    small 'index.json' sidecar.
+    """
+    fields = list(panel)
+    first = panel[fields[0]]
+    os.makedirs(path, exist_ok=True)
+
+    shape = (len(fields), len(first.index), len(first.columns))
+    values = np.lib.format.open_memmap(os.path.join(path, "panel.npy"), mode="w+", dtype=np.float64, shape=shape)
+    for i, field in enumerate(fields):
+        values[i] = panel[field].reindex(index=first.index, columns=first.columns).to_numpy(dtype=np.float64, na_value=np.nan)
+    values.flush()
+    del values
+
+    index = {
+        "fields": fields,
+        "dates": [str(date) for date in first.index.strftime("%Y-%m-%d")],
+        "tickers": [str(ticker) for ticker in first.columns],
+    }
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(index, f)
+
+class PanelStore:
+    """
+    Panel store opens a directory written by save_panel with memory
+    mapping. Slicing a field, a ticker or a date range returns a numpy
+    view onto the mapped file, so nothing is read from disk until it is
+    used and processes on the same machine share the same pages.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "index.json")) as f:
+            index = json.load(f)
+        self.fields = index["fields"]
+        self.dates = pd.DatetimeIndex(index["dates"], name="Dates")
+        self.tickers = pd.Index(index["tickers"])
+        self.values = np.load(os.path.join(path, "panel.npy"), mmap_mode="r")
+
+    def rows(self, start=None, end=None):
+        """
+        Rows turns a date range, both ends inclusive, into a slice along
+        the date axis.
+        """
+        lo = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side="left")
+        hi = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side="right")
+        return slice(lo, hi)
+
+    def field(self, field, start=None, end=None):
+        """
+        Field returns a (date x ticker) view of one field.
+        """
+        return self.values[self.fields.index(field), self.rows(start, end)]
+
+    def ticker(self, ticker, start=None, end=None):
+        """
+        Ticker returns a (field x date) view of one ticker.
+        """
+        return self.values[:, self.rows(start, end), self.tickers.get_loc(ticker)]
+
+    def frame(self, field, start=None, end=None):
+        """
+        Frame wraps the view from field in a DataFrame with the date and
+        ticker labels, without copying the values.
+        """
+        rows = self.rows(start, end)
+        return pd.DataFrame(self.values[self.fields.index(field), rows],
+                            index=self.dates[rows], columns=self.tickers, copy=False)
@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tarfile
+import zipfile
+import numpy as np
+import pytest
+from archive import ArchiveWriter, index_path, read_member
+
+def make_files(count=12):
+    """
+    Make files returns some members of different sizes, text and
+    binary, one of them empty.
+    """
+    rng = np.random.default_rng(0)
+    files = {"close.csv": b"", "volume.csv": "Dates,AAPL\n2020-01-02,100\n"}
+    for j in range(count):
+        files["returns/part_{}.bin".format(j)] = rng.bytes(int(rng.integers(1, 200000)))
+
+    return files
+
+def write_archive(path, root, files, workers):
+    writer = ArchiveWriter(str(path), root=str(root), workers=workers)
+    for name, data in files.items():
+        writer.add(os.path.join(str(root), name), data)
+
+    return writer.close()
+
+def as_bytes(data):
+    return data.encode() if isinstance(data, str) else data
+
+@pytest.mark.parametrize("name", ["out.tar.gz", "out.tgz", "out.zip"])
+@pytest.mark.parametrize("workers", [1, 4])
+def test_round_trip(tmp_path, name, workers):
+    files = make_files()
+    path = write_archive(tmp_path / name, tmp_path, files, workers)
+    assert not os.path.exists(path + ".tmp")
+    for member, data in files.items():
+        assert read_member(path, member) == as_bytes(data)
+
+    with open(index_path(path)) as f:
+        assert list(json.load(f)["members"]) == list(files)
+
+def test_standard_readers(tmp_path):
+    files = make_files()
+    path = write_archive(tmp_path / "out.tar.gz", tmp_path, files, 4)
+    with tarfile.open(path) as archive:
+        assert archive.getnames() == list(files)
+        for member, data in files.items():
+            assert archive.extractfile(member).read() == as_bytes(data)
+
+    path = write_archive(tmp_path / "out.zip", tmp_path, files, 4)
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == list(files)
+        for member, data in files.items():
+            assert archive.read(member) == as_bytes(data)
+
+def test_bad_names(tmp_path):
+    with pytest.raises(Exception, match="Archive must end"):
+        ArchiveWriter(str(tmp_path / "out.rar"))
+    path = write_archive(tmp_path / "out.zip", tmp_path, {"a.csv": b"1"}, 1)
+    with pytest.raises(Exception, match="is not in"):
+        read_member(path, "b.csv")
+
+    writer = ArchiveWriter(str(tmp_path / "twice.tar.gz"), root=str(tmp_path), workers=1)
+    writer.add(str(tmp_path / "a.csv"), b"1")
+    with pytest.raises(Exception, match="already in the archive"):
+        writer.add(str(tmp_path / "a.csv"), b"2")
+        writer.close()
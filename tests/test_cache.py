@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from cache import TickerCache
+
+class Source:
+    """
+    Source stands in for yahoo and records every span it was asked for.
+    Prices are made up from the date so every call agrees on a day.
+    """
+
+    def __init__(self):
+        self.calls = list()
+
+    def __call__(self, tag, start, end, timeout=30):
+        self.calls.append((tag, start, end))
+        dates = pd.bdate_range(start, end, name="Date")
+        close = 100 + (dates - pd.Timestamp("2020-01-01")).days.to_numpy(dtype=np.float64)
+        return pd.DataFrame({"Close": close, "Volume": np.full(len(dates), 1000), "Ticker": tag}, index=dates)
+
+def day(text):
+    return datetime.date.fromisoformat(text)
+
+def test_only_missing_spans_are_fetched(tmp_path):
+    source = Source()
+    cache = TickerCache(str(tmp_path), source)
+    cache.fetch("AAPL", day("2020-02-03"), day("2020-02-28"))
+    cache.fetch("AAPL", day("2020-01-06"), day("2020-03-31"))
+    assert source.calls == [("AAPL", day("2020-02-03"), day("2020-02-28")),
+                            ("AAPL", day("2020-01-06"), day("2020-02-02")),
+                            ("AAPL", day("2020-02-29"), day("2020-03-31"))]
+
+    data = cache.fetch("AAPL", day("2020-01-06"), day("2020-03-31"))
+    assert len(source.calls) == 3
+    pd.testing.assert_frame_equal(data, source("AAPL", day("2020-01-06"), day("2020-03-31")), check_freq=False)
+    assert cache.index["AAPL"]["spans"] == [["2020-01-06", "2020-03-31"]]
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 3
+
+def test_weekend_gaps_are_not_asked_for(tmp_path):
+    source = Source()
+    cache = TickerCache(str(tmp_path), source)
+    cache.fetch("KO", day("2020-01-06"), day("2020-01-10"))
+    cache.fetch("KO", day("2020-01-13"), day("2020-01-17"))
+    cache.fetch("KO", day("2020-01-06"), day("2020-01-19"))
+    assert [call[1:] for call in source.calls] == [(day("2020-01-06"), day("2020-01-10")),
+                                                   (day("2020-01-13"), day("2020-01-17"))]
+    assert cache.missing("KO", day("2020-01-06"), day("2020-01-19")) == list()
+
+def test_index_is_kept_on_disk(tmp_path):
+    cache = TickerCache(str(tmp_path), Source())
+    cache.fetch("IBM", day("2020-01-06"), day("2020-01-31"))
+    cache.save()
+
+    source = Source()
+    again = TickerCache(str(tmp_path), source)
+    assert len(again.fetch("IBM", day("2020-01-06"), day("2020-01-31"))) == 20
+    assert source.calls == list()
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = TickerCache(str(tmp_path), Source())
+    for tag in ["AAA", "BBB", "CCC"]:
+        cache.fetch(tag, day("2020-01-01"), day("2020-12-31"))
+    cache.fetch("AAA", day("2020-06-01"), day("2020-06-30"))
+    size = max(entry["bytes"] for entry in cache.index.values())
+    cache.max_bytes = 2 * size
+    cache.save()
+    assert sorted(cache.index) == ["AAA", "CCC"]
+    assert not (tmp_path / "BBB.pkl").exists()
+    assert (tmp_path / "AAA.pkl").exists()
+
+def test_failed_source_raises(tmp_path):
+    def broken(tag, start, end, timeout=30):
+        raise Exception("down")
+
+    cache = TickerCache(str(tmp_path), broken)
+    with pytest.raises(Exception, match="No data for XOM"):
+        cache.fetch("XOM", day("2020-01-06"), day("2020-01-31"))
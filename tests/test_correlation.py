@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import pytest
+from correlation import block_matrices, cached_matrices
+
+def make_returns(seed, days=200, tickers=23, holes=0.1):
+    """
+    Make returns builds a correlated returns panel with a share 'holes'
+    of the values missing, and one ticker with too few days to pair.
+    """
+    rng = np.random.default_rng(seed)
+    common = rng.normal(0, 0.01, (days, 1))
+    values = common * rng.normal(1, 0.3, tickers) + rng.normal(0, 0.01, (days, tickers))
+    returns = pd.DataFrame(values, index=pd.bdate_range("2020-01-01", periods=days),
+                           columns=["T{:02d}".format(j) for j in range(tickers)])
+    returns = returns.mask(rng.random(returns.shape) < holes)
+    returns.iloc[1:, -1] = np.nan
+
+    return returns
+
+@pytest.mark.parametrize("block,workers", [(256, 1), (5, 1), (4, 3)])
+def test_block_matrices_match_pandas(block, workers):
+    returns = make_returns(0)
+    cov, corr = block_matrices(returns, block=block, workers=workers)
+    pd.testing.assert_frame_equal(cov, returns.cov(), rtol=1e-8, atol=1e-15)
+    pd.testing.assert_frame_equal(corr, returns.corr(), rtol=1e-8, atol=1e-15)
+
+def test_min_periods_like_pandas():
+    returns = make_returns(1, days=30, holes=0.5)
+    cov, corr = block_matrices(returns, block=7, min_periods=10)
+    pd.testing.assert_frame_equal(cov, returns.cov(min_periods=10), rtol=1e-8, atol=1e-15)
+    pd.testing.assert_frame_equal(corr, returns.corr(min_periods=10), rtol=1e-8, atol=1e-15)
+
+def test_shrinkage_pulls_towards_identity():
+    returns = make_returns(2, holes=0)
+    returns = returns.iloc[:, :-1]
+    cov, corr = block_matrices(returns, block=4, shrinkage=0.25)
+    target = np.diag(returns.cov()).mean()
+    np.testing.assert_allclose(cov, 0.75 * returns.cov() + 0.25 * target * np.eye(returns.shape[1]), rtol=1e-8)
+    np.testing.assert_allclose(corr, 0.75 * returns.corr() + 0.25 * np.eye(returns.shape[1]), rtol=1e-8)
+
+def test_cached_matrices_reads_back(tmp_path):
+    returns = make_returns(3)
+    cov, corr = cached_matrices(returns, str(tmp_path), block=8)
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+    again = cached_matrices(returns, str(tmp_path), block=8)
+    pd.testing.assert_frame_equal(again[0], cov)
+    pd.testing.assert_frame_equal(again[1], corr)
+    cached_matrices(returns * 2, str(tmp_path), block=8)
+    assert len(list(tmp_path.glob("*.npz"))) == 2
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import json
+import random
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from external import fetch_all, fetch_ticker
+
+TICKERS = ["MSFT", "AAPL", "BAD", "KO", "IBM", "GE", "SLOW", "XOM"]
+
+def stub_fetch(tag, start, end, timeout=30):
+    """
+    Stub fetch stands in for yahoo: every ticker takes a random while,
+    'SLOW' takes longest so it finishes last, and 'BAD' always fails.
+    """
+    time.sleep(0.2 if tag == "SLOW" else random.uniform(0, 0.02))
+    if tag == "BAD":
+        raise Exception("no data for BAD")
+    rng = np.random.default_rng(sum(tag.encode()))
+    dates = pd.bdate_range(start, end, name="Date")
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+    data = pd.DataFrame({"High": close * 1.01, "Low": close * 0.99, "Open": close, "Close": close,
+                         "Volume": rng.integers(1000, 100000, len(dates)), "Adj Close": close}, index=dates)
+    data = data[rng.random(len(dates)) >= 0.05]
+    data["Ticker"] = tag
+    return data
+
+def test_fetch_all_keeps_sorted_order():
+    data_list = fetch_all(TICKERS, "2020-01-01", "2020-03-31", workers=8, fetch=stub_fetch)
+    tags = [data["Ticker"].iloc[0] for data in data_list]
+    assert tags == sorted(tag for tag in TICKERS if tag != "BAD")
+
+def test_fetch_all_retries():
+    calls = dict()
+
+    def flaky(tag, start, end, timeout=30):
+        calls[tag] = calls.get(tag, 0) + 1
+        if calls[tag] == 1:
+            raise Exception("first try fails")
+        return stub_fetch(tag, start, end, timeout)
+
+    data_list = fetch_all(["AAPL", "KO"], "2020-01-01", "2020-01-31", workers=2, fetch=flaky, retries=1)
+    assert [data["Ticker"].iloc[0] for data in data_list] == ["AAPL", "KO"]
+
+def test_workers_give_identical_data():
+    outputs = list()
+    for workers in [1, 8]:
+        data_list = fetch_all(TICKERS, "2020-01-01", "2020-06-30", workers=workers, fetch=stub_fetch)
+        outputs.append(pd.concat(data_list).to_csv())
+    assert outputs[0] == outputs[1]
+
+class YahooStub(BaseHTTPRequestHandler):
+    """
+    Yahoo stub answers like the yahoo history page the daily reader of
+    pandas_datareader scrapes, with the prices of a few days in the page
+    script. 'SLOW' waits a second before answering and 'BAD' is not
+    found.
+    """
+
+    def do_GET(self):
+        tag = re.match(r"/quote/([^/]+)/history", self.path).group(1)
+        time.sleep(1 if tag == "SLOW" else 0.01)
+        if tag == "BAD":
+            self.send_response(404)
+            self.end_headers()
+            return
+        days = pd.bdate_range("2020-01-02", periods=5)
+        prices = [{"date": int(day.timestamp()) + 14 * 60 * 60, "open": 10.0 + i, "high": 11.0 + i, "low": 9.0 + i,
+                   "close": 10.5 + i, "volume": 1000 * (i + 1), "adjclose": 10.0 + i} for i, day in enumerate(days)]
+        store = {"context": {"dispatcher": {"stores": {"HistoricalPriceStore": {"prices": prices}}}}}
+        page = "<script>root.App.main = {};\n}}(this));</script>".format(json.dumps(store))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        self.wfile.write(page.encode())
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def yahoo(monkeypatch):
+    """
+    Yahoo points the daily reader of pandas_datareader at a YahooStub
+    running on a local port.
+    """
+    daily = pytest.importorskip("pandas_datareader.yahoo.daily")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), YahooStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/quote/{{}}/history".format(server.server_port)
+    monkeypatch.setattr(daily.YahooDailyReader, "url", property(lambda self: url))
+    monkeypatch.setattr(daily.YahooDailyReader, "pause", 0, raising=False)
+    yield
+    server.shutdown()
+    server.server_close()
+
+def test_fetch_ticker_reads_yahoo(yahoo):
+    data = fetch_ticker("AAPL", pd.Timestamp("2020-01-01"), pd.Timestamp("2020-01-31"), timeout=5)
+    assert list(data.index) == list(pd.bdate_range("2020-01-02", periods=5))
+    assert list(data["Close"]) == [10.5, 11.5, 12.5, 13.5, 14.5]
+    assert list(data["Volume"]) == [1000, 2000, 3000, 4000, 5000]
+    assert (data["Ticker"] == "AAPL").all()
+
+def test_fetch_ticker_times_out(yahoo):
+    begin = time.perf_counter()
+    with pytest.raises(Exception):
+        fetch_ticker("SLOW", pd.Timestamp("2020-01-01"), pd.Timestamp("2020-01-31"), timeout=0.2)
+    assert time.perf_counter() - begin < 0.9
+
+def test_fetch_all_over_yahoo(yahoo):
+    data_list = fetch_all(["SLOW", "KO", "BAD", "AAPL"], pd.Timestamp("2020-01-01"), pd.Timestamp("2020-01-31"),
+                          workers=4, timeout=0.2)
+    assert [data["Ticker"].iloc[0] for data in data_list] == ["AAPL", "KO"]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import pytest
+from horizons import panel_returns, returns_name
+
+def make_panel(seed, days=80, tickers=5):
+    """
+    Make panel builds a Close and Volume panel with some prices missing,
+    one ticker starting late and a day no ticker traded.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2020-01-01", periods=days)
+    columns = ["T{}".format(j) for j in range(tickers)]
+    close = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.01, (days, tickers)), axis=0)), index=dates, columns=columns)
+    close = close.mask(rng.random(close.shape) < 0.1)
+    close.iloc[:20, 0] = np.nan
+    close.iloc[30] = np.nan
+    volume = pd.DataFrame(rng.integers(1000, 5000, (days, tickers)), index=dates, columns=columns).astype(np.float64)
+    volume = volume.mask(close.isna())
+
+    return {"Close": close, "Volume": volume}
+
+@pytest.mark.parametrize("horizon", [1, 5])
+def test_simple_and_log_match_pandas(horizon):
+    panel = make_panel(0)
+    results = panel_returns(panel, horizons=(horizon,), kinds=("simple", "log"))
+    for field in panel:
+        expected = panel[field].pct_change(horizon, fill_method=None)
+        pd.testing.assert_frame_equal(results[(field, "simple", horizon)], expected, rtol=1e-12)
+        expected = np.log(panel[field] / panel[field].shift(horizon))
+        pd.testing.assert_frame_equal(results[(field, "log", horizon)], expected, rtol=1e-12)
+
+def test_nan_modes():
+    panel = make_panel(1)
+    close = panel["Close"]
+    results = panel_returns(panel, fields=["Close"], horizons=(1, 3), nan="ffill")
+    pd.testing.assert_frame_equal(results[("Close", "simple", 3)], close.ffill().pct_change(3, fill_method=None), rtol=1e-12)
+
+    results = panel_returns(panel, fields=["Close"], horizons=(3,), nan="zero")
+    expected = close.pct_change(3, fill_method=None)
+    expected.iloc[3:] = expected.iloc[3:].fillna(0)
+    pd.testing.assert_frame_equal(results[("Close", "simple", 3)], expected, rtol=1e-12)
+
+    results = panel_returns(panel, fields=["Close"], nan="drop")
+    expected = close.pct_change(fill_method=None).dropna(how="all")
+    pd.testing.assert_frame_equal(results[("Close", "simple", 1)], expected, rtol=1e-12)
+
+def test_dtype_and_bad_options():
+    panel = make_panel(2)
+    results = panel_returns(panel, dtype=np.float32)
+    assert all(dtype == np.float32 for dtype in results[("Close", "simple", 1)].dtypes)
+    for options in [{"nan": "mean"}, {"kinds": ("excess",)}, {"horizons": (0,)}]:
+        with pytest.raises(Exception):
+            panel_returns(panel, **options)
+
+def test_returns_name():
+    assert returns_name("close", "simple", 1) == "close_pct_change"
+    assert returns_name("close", "log", 5) == "close_log_5d"
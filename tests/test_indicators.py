@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import pytest
+from indicators import Indicators
+
+def make_panel(seed, days=150, tickers=4):
+    """
+    Make panel builds a High, Low, Close and Volume panel with some days
+    missing and one ticker that starts late.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2020-01-01", periods=days)
+    columns = ["T{}".format(j) for j in range(tickers)]
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (days, tickers)), axis=0))
+    spread = np.abs(rng.normal(0, 1, (days, tickers)))
+    missing = rng.random((days, tickers)) < 0.05
+    missing[:30, 0] = True
+    panel = dict()
+    for field, values in [("High", close + spread), ("Low", close - spread), ("Close", close),
+                          ("Volume", rng.integers(1000, 5000, (days, tickers)).astype(np.float64))]:
+        panel[field] = pd.DataFrame(np.where(missing, np.nan, values), index=dates, columns=columns)
+
+    return panel
+
+def rows(panel, lo, hi):
+    return {field: frame.iloc[lo:hi] for field, frame in panel.items()}
+
+@pytest.mark.parametrize("cuts", [[100], [1, 2, 60, 61, 149], [10, 40, 70, 100, 130]])
+def test_split_updates_match_one_update(cuts):
+    panel = make_panel(0)
+    expected = Indicators().update(panel)
+
+    indicators = Indicators()
+    parts = list()
+    for lo, hi in zip([0] + cuts, cuts + [len(panel["Close"])]):
+        parts.append(indicators.update(rows(panel, lo, hi)))
+    for name in expected:
+        got = pd.concat([part[name] for part in parts])
+        pd.testing.assert_frame_equal(got, expected[name], rtol=1e-9, atol=1e-9)
+
+def test_moving_averages_match_pandas():
+    panel = make_panel(1)
+    panel = {field: frame.ffill().bfill() for field, frame in panel.items()}
+    results = Indicators(sma=(5, 20), ema=(12,), bollinger=20).update(panel)
+    close = panel["Close"]
+    pd.testing.assert_frame_equal(results["sma_20"], close.rolling(20).mean(), rtol=1e-9)
+    pd.testing.assert_frame_equal(results["ema_12"], close.ewm(span=12, adjust=False, min_periods=12).mean(), rtol=1e-9)
+    upper = close.rolling(20).mean() + 2 * close.rolling(20).std(ddof=0)
+    pd.testing.assert_frame_equal(results["bollinger_upper_20"], upper, rtol=1e-9)
+
+def test_saved_indicators_carry_on(tmp_path):
+    panel = make_panel(2)
+    expected = Indicators().update(panel)
+    indicators = Indicators()
+    indicators.update(rows(panel, 0, 90))
+    indicators.save(str(tmp_path / "state.pkl"))
+    got = Indicators.load(str(tmp_path / "state.pkl")).update(rows(panel, 90, 150))
+    for name in expected:
+        pd.testing.assert_frame_equal(got[name], expected[name].iloc[90:], rtol=1e-9, atol=1e-9)
+
+def test_missing_inputs_raise():
+    panel = make_panel(3)
+    del panel["Volume"]
+    with pytest.raises(Exception, match="Indicators need"):
+        Indicators().update(panel)
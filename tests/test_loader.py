@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+import pandas as pd
+from loader import SIDECAR, load_panel, load_returns, read_csv
+
+def write_wide(root, shuffle=False):
+    """
+    Write wide writes the six field files external.py makes, with the
+    dates shuffled like some older runs wrote them.
+    """
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2020-01-01", periods=30, name="Dates")
+    for name in ["high", "low", "open", "close", "volume", "adj_close", "close_pct_change"]:
+        frame = pd.DataFrame(rng.normal(100, 1, (30, 3)), index=dates, columns=["AAA", "BBB", "CCC"])
+        frame.iloc[3, 1] = np.nan
+        if shuffle:
+            frame = frame.iloc[rng.permutation(30)]
+        frame.to_csv(os.path.join(root, name + ".csv"))
+
+def test_read_csv_types_and_order(tmp_path):
+    write_wide(str(tmp_path), shuffle=True)
+    frame = read_csv(str(tmp_path / "close.csv"))
+    expected = pd.read_csv(str(tmp_path / "close.csv"), index_col=0, parse_dates=True,
+                           float_precision="round_trip").sort_index()
+    assert frame.index.is_monotonic_increasing
+    assert all(dtype == np.float64 for dtype in frame.dtypes)
+    np.testing.assert_array_equal(frame.to_numpy(), expected.to_numpy())
+
+def test_sidecar_is_used_until_the_file_changes(tmp_path):
+    write_wide(str(tmp_path), shuffle=True)
+    panel = load_panel(str(tmp_path))
+    assert os.path.exists(str(tmp_path / SIDECAR / "close.csv.pkl"))
+    assert panel["Close"].index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(load_panel(str(tmp_path))["Close"], panel["Close"])
+    assert len(panel["Close"].loc["2020-01-06":"2020-01-10"]) == 5
+
+    frame = panel["Close"] * 2
+    frame.to_csv(str(tmp_path / "close.csv"))
+    pd.testing.assert_frame_equal(load_panel(str(tmp_path))["Close"], frame, check_freq=False)
+    assert load_returns(str(tmp_path), ["Close"])["Close"].shape == (30, 3)
+
+def test_ticker_folders(tmp_path):
+    write_wide(str(tmp_path))
+    wide = load_panel(str(tmp_path), sidecar=False)
+    folders = tmp_path / "folders"
+    for tag in ["AAA", "BBB", "CCC"]:
+        os.makedirs(str(folders / tag))
+        for name, field in [("close", "Close"), ("volume", "Volume")]:
+            wide[field][[tag]].rename(columns={tag: name}).to_csv(str(folders / tag / (name + ".csv")))
+    panel = load_panel(str(folders), ["Close", "Volume"])
+    for field in ["Close", "Volume"]:
+        pd.testing.assert_frame_equal(panel[field], wide[field], check_freq=False)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import pytest
+from regress import RollingBeta, fit_returns, market_return, rolling_beta
+
+def make_returns(seed, days=300, tickers=6, holes=0.05):
+    """
+    Make returns builds a returns panel that follows two factors, with
+    a share 'holes' of the returns missing and one infinite value.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2019-01-01", periods=days)
+    factors = pd.DataFrame(rng.normal(0, 0.01, (days, 2)), index=dates, columns=["SPY", "TLT"])
+    loadings = rng.normal(1, 0.5, (2, tickers))
+    noise = rng.normal(0, 0.01, (days, tickers))
+    returns = pd.DataFrame(0.0002 + factors.to_numpy() @ loadings + noise, index=dates,
+                           columns=["T{}".format(j) for j in range(tickers)])
+    returns = returns.mask(rng.random(returns.shape) < holes)
+    returns.iloc[5, 1] = np.inf
+    factors.iloc[7, 0] = np.nan
+
+    return returns, factors
+
+def lstsq_fit(y, X):
+    """
+    Lstsq fit is the plain regression of one ticker, for reference.
+    """
+    X = np.column_stack([np.ones(len(X)), X])
+    beta = np.linalg.lstsq(X, y, rcond=None)[0]
+    resid = y - X @ beta
+    n, k = X.shape
+    sigma2 = resid @ resid / (n - k)
+    se = np.sqrt(np.diag(np.linalg.inv(X.T @ X)) * sigma2)
+    r2 = 1 - resid @ resid / ((y - y.mean()) @ (y - y.mean()))
+
+    return beta, beta / se, r2, n
+
+def test_fit_returns_matches_lstsq():
+    returns, factors = make_returns(0)
+    result = fit_returns(returns, factors)
+    assert list(result.columns) == ["alpha", "beta_SPY", "beta_TLT", "t_alpha", "t_beta_SPY", "t_beta_TLT", "r2", "nobs"]
+    for ticker in returns.columns:
+        both = pd.concat([returns[ticker], factors], axis=1).replace([np.inf, -np.inf], np.nan).dropna()
+        beta, tstat, r2, n = lstsq_fit(both[ticker].to_numpy(), both[["SPY", "TLT"]].to_numpy())
+        row = result.loc[ticker]
+        np.testing.assert_allclose(row[["alpha", "beta_SPY", "beta_TLT"]].to_numpy(dtype=np.float64), beta, rtol=1e-8)
+        np.testing.assert_allclose(row[["t_alpha", "t_beta_SPY", "t_beta_TLT"]].to_numpy(dtype=np.float64), tstat, rtol=1e-8)
+        assert row["r2"] == pytest.approx(r2, rel=1e-8)
+        assert row["nobs"] == n
+
+def test_fit_returns_short_tickers_are_nan():
+    returns, factors = make_returns(1, days=40)
+    returns["T0"] = np.nan
+    returns.iloc[:37, 1] = np.nan
+    result = fit_returns(returns, factors)
+    assert result.loc[["T0", "T1"]].drop(columns="nobs").isna().all().all()
+    assert result.loc["T2"].notna().all()
+
+def test_market_return_is_the_row_mean():
+    returns, _ = make_returns(2)
+    returns = returns.replace(np.inf, np.nan)
+    pd.testing.assert_series_equal(market_return(returns)["market"], returns.mean(axis=1), check_names=False)
+
+def test_rolling_beta_matches_pandas():
+    returns, factors = make_returns(3, holes=0)
+    returns = returns.replace(np.inf, 0.0)
+    market = factors["SPY"].fillna(0.0)
+    alpha, beta, corr = rolling_beta(returns, market, window=30)
+    for ticker in returns.columns:
+        rolling = returns[ticker].rolling(30)
+        expected = rolling.cov(market) / market.rolling(30).var()
+        pd.testing.assert_series_equal(beta[ticker], expected, check_names=False, rtol=1e-6)
+        pd.testing.assert_series_equal(corr[ticker], rolling.corr(market), check_names=False, rtol=1e-6)
+        expected = rolling.mean() - expected * market.rolling(30).mean()
+        pd.testing.assert_series_equal(alpha[ticker], expected, check_names=False, rtol=1e-6, atol=1e-12)
+
+def test_rolling_beta_skips_missing_days():
+    returns, factors = make_returns(4, days=120, holes=0.2)
+    market = factors["SPY"]
+    alpha, beta, corr = rolling_beta(returns, market, window=20, min_periods=10)
+    for t in range(len(returns)):
+        for ticker in returns.columns:
+            window = pd.concat([returns[ticker], market], axis=1).iloc[max(0, t - 19):t + 1]
+            window = window.replace([np.inf, -np.inf], np.nan).dropna()
+            if len(window) < 10:
+                assert np.isnan(beta[ticker].iloc[t])
+                continue
+            y, x = window.iloc[:, 0].to_numpy(), window.iloc[:, 1].to_numpy()
+            slope, intercept = np.polyfit(x, y, 1)
+            assert beta[ticker].iloc[t] == pytest.approx(slope, rel=1e-6)
+            assert alpha[ticker].iloc[t] == pytest.approx(intercept, rel=1e-6, abs=1e-12)
+            assert corr[ticker].iloc[t] == pytest.approx(np.corrcoef(x, y)[0, 1], rel=1e-6)
+
+def test_rolling_updates_match_rolling_beta():
+    returns, factors = make_returns(5, days=150, holes=0.1)
+    market = factors["SPY"]
+    expected = rolling_beta(returns, market, window=25, min_periods=15)
+    model = RollingBeta(returns.columns, window=25, min_periods=15)
+    for date in returns.index:
+        for got, frame in zip(model.update(returns.loc[date], market.loc[date]), expected):
+            pd.testing.assert_series_equal(got, frame.loc[date], check_names=False, rtol=1e-8, atol=1e-12)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from bench import synthetic_ticker
+from external import main
+
+MODES = [[], ["-v"], ["-v", "--combined", "-f", "parquet"], ["-q", "Close,Volume"], ["--fill", "ffill"], ["--join", "inner"],
+         ["-v", "--fill", "bfill"]]
+
+def make_local(root, gaps):
+    """
+    Make local writes an output directory the local source can replay,
+    four tickers with their own 'all.csv'. With gaps only 'WKND' trades
+    on two Saturdays and 'CCC' misses some days. Without gaps every
+    ticker has every day, Saturdays too, so volume stays integer
+    through the panel.
+    """
+    dates = pd.bdate_range("2020-01-01", "2020-12-31").append(pd.DatetimeIndex(["2020-03-07", "2020-06-13"])).sort_values()
+    for k, tag in enumerate(["AAA", "BBB", "CCC", "WKND"]):
+        data = synthetic_ticker(tag, dates, np.random.default_rng(k), gaps=0.02 if gaps and tag == "CCC" else 0)
+        data = data.drop(columns="Ticker")
+        if gaps and tag != "WKND":
+            data = data[data.index.dayofweek < 5]
+        data.index.name = "Dates"
+        data.columns = [column.lower().replace(" ", "_") for column in data.columns]
+        os.makedirs(os.path.join(root, tag))
+        data.to_csv(os.path.join(root, tag, "all.csv"))
+
+def read_tree(root):
+    """
+    Read tree returns every file under root by its relative path.
+    """
+    files = dict()
+    for folder, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(folder, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root)] = f.read()
+
+    return files
+
+def run(tmp_path, local, name, options):
+    """
+    Run writes one run of external.py on the local source into its own
+    folder and returns its files.
+    """
+    output = str(tmp_path / name)
+    main(["--source", "local", "--local", local, "-s", "2020-01-01", "-e", "2020-12-31", "--output", output] + options)
+    return read_tree(output)
+
+@pytest.mark.parametrize("gaps", [False, True])
+@pytest.mark.parametrize("mode", MODES)
+def test_same_output(tmp_path, gaps, mode):
+    local = str(tmp_path / "local")
+    make_local(local, gaps)
+    expected = run(tmp_path, local, "single", mode)
+    assert len(expected) > 0
+    assert run(tmp_path, local, "sharded", mode + ["--processes", "2"]) == expected
+
+def test_weekend_bars_and_integer_volume(tmp_path):
+    local = str(tmp_path / "local")
+    make_local(local, False)
+    for processes in ["1", "2", "3"]:
+        output = str(tmp_path / processes)
+        main(["--source", "local", "--local", local, "-s", "2020-01-01", "-e", "2020-12-31", "--output", output,
+              "--processes", processes])
+        volume = pd.read_csv(os.path.join(output, "volume.csv"), index_col=0)
+        assert "2020-03-07" in volume.index
+        assert all(dtype == np.int64 for dtype in volume.dtypes)
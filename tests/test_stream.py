@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from external import FIELDS, NAMES, StreamWriter, align_panel, build_panel, fetch_all, write_frame, write_tickers
+
+# Two Saturdays only WKND traded on
+DATES = pd.bdate_range("2020-01-01", "2020-06-30").append(pd.DatetimeIndex(["2020-03-07", "2020-06-13"])).sort_values()
+
+def make_downloads(gaps):
+    """
+    Make downloads returns a DataFrame per ticker shaped like a yahoo
+    download. With gaps 'CCC' misses some days and only 'WKND' has the
+    Saturday bars. Without gaps every ticker has every day, so volume
+    stays integer.
+    """
+    downloads = dict()
+    for k, tag in enumerate(["AAA", "BBB", "CCC", "WKND"]):
+        rng = np.random.default_rng(k)
+        close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, len(DATES))))
+        data = pd.DataFrame({"High": close * 1.01, "Low": close * 0.99, "Open": close, "Close": close,
+                             "Volume": rng.integers(1000, 5000, len(DATES)), "Adj Close": close * 0.98},
+                            index=DATES.rename("Date"))
+        if gaps and tag == "CCC":
+            data = data[rng.random(len(data)) >= 0.05]
+        if gaps and tag != "WKND":
+            data = data[data.index.dayofweek < 5]
+        data["Ticker"] = tag
+        downloads[tag] = data
+
+    return downloads
+
+def read_tree(root):
+    """
+    Read tree returns every file under root by its relative path.
+    """
+    files = dict()
+    for folder, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(folder, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root)] = f.read()
+
+    return files
+
+MODES = [dict(), {"verbose": True}, {"verbose": True, "combined": True, "fmt": "parquet"}, {"fields": ["Close", "Volume"]},
+         {"fill": "ffill"}, {"join": "inner"}, {"verbose": True, "fill": "bfill"}, {"verbose": True, "join": "inner"}]
+
+@pytest.mark.parametrize("gaps", [False, True])
+@pytest.mark.parametrize("mode", MODES)
+def test_stream_matches_the_panel(tmp_path, gaps, mode):
+    downloads = make_downloads(gaps)
+
+    def fetch(tag, start, end, timeout=30):
+        return downloads[tag].copy()
+
+    fields = mode.get("fields", FIELDS)
+    names = [NAMES[FIELDS.index(field)] for field in fields]
+    fmt = mode.get("fmt", "csv")
+    verbose = mode.get("verbose", False)
+    join = mode.get("join", "outer")
+    fill = mode.get("fill", "none")
+    combined = mode.get("combined", False)
+    start, end = pd.Timestamp("2020-01-01"), pd.Timestamp("2020-06-30")
+
+    expected = str(tmp_path / "panel")
+    os.makedirs(expected)
+    panel, gaps_panel = align_panel(build_panel(fetch_all(sorted(downloads), start, end, fetch=fetch), fields), join, fill)
+    if verbose:
+        write_tickers(panel, fields, names, expected, fmt, combined=combined)
+    else:
+        for field, name in zip(fields, names):
+            write_frame(panel[field], os.path.join(expected, name), fmt)
+
+    streamed = str(tmp_path / "stream")
+    os.makedirs(streamed)
+    writer = StreamWriter(sorted(downloads), start, end, fields, names, fmt, verbose=verbose, join=join, fill=fill,
+                          block=7, root=streamed, combined=combined)
+    fetch_all(sorted(downloads), start, end, workers=4, fetch=fetch, on_data=writer.add)
+    assert writer.close() == gaps_panel
+
+    files = read_tree(streamed)
+    assert len(files) > 0
+    assert files == read_tree(expected)
+    if not verbose:
+        volume = pd.read_csv(os.path.join(streamed, "volume.csv"), index_col=0)
+        assert ("2020-03-07" in volume.index) == (join == "outer" or not gaps)
+        assert all(dtype == (np.float64 if gaps else np.int64) for dtype in volume.dtypes)
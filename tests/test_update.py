@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from external import main
+from regress import rolling_beta
+
+def make_local(root):
+    """
+    Make local writes a directory the local source can replay, three
+    tickers over 2020 with one of them missing some days.
+    """
+    dates = pd.bdate_range("2020-01-01", "2020-12-31", name="Dates")
+    for k, tag in enumerate(["AAA", "BBB", "CCC"]):
+        rng = np.random.default_rng(k)
+        close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+        data = pd.DataFrame({"high": close * 1.01, "low": close * 0.99, "open": close, "close": close,
+                             "volume": rng.integers(1000, 5000, len(dates)), "adj_close": close}, index=dates)
+        if tag == "CCC":
+            data = data[rng.random(len(data)) > 0.05]
+        os.makedirs(os.path.join(root, tag))
+        data.to_csv(os.path.join(root, tag, "all.csv"))
+
+def run(local, output, start, end, options):
+    main(["--source", "local", "--local", local, "-s", start, "-e", end, "--output", output] + options)
+
+def read_files(root):
+    files = dict()
+    for name in sorted(os.listdir(root)):
+        if not name.startswith("."):
+            with open(os.path.join(root, name), "rb") as f:
+                files[name] = f.read()
+
+    return files
+
+@pytest.mark.parametrize("options", [[], ["-r"], ["-r", "--regressors", "BBB"]])
+def test_update_matches_a_full_run(tmp_path, options):
+    local = str(tmp_path / "local")
+    make_local(local)
+    full = str(tmp_path / "full")
+    run(local, full, "2020-01-01", "2020-12-31", options)
+    part = str(tmp_path / "part")
+    run(local, part, "2020-01-01", "2020-09-30", options)
+    run(local, part, "2020-01-01", "2020-12-31", options + ["--update"])
+
+    expected = read_files(full)
+    got = read_files(part)
+    assert sorted(got) == sorted(expected)
+    for name in expected:
+        if "_sm" not in name: # Fits over the whole history are left for a full run
+            assert got[name] == expected[name], name
+
+def test_rolling_fits_carry_on(tmp_path):
+    local = str(tmp_path / "local")
+    make_local(local)
+    part = str(tmp_path / "part")
+    run(local, part, "2020-01-01", "2020-06-30", ["-r", "--rolling", "20"])
+    run(local, part, "2020-01-01", "2020-12-31", ["-r", "--rolling", "20", "--update"])
+
+    returns = pd.read_csv(os.path.join(part, "close_pct_change.csv"), index_col=0, parse_dates=True)
+    expected = rolling_beta(returns, returns.mean(axis=1), window=20)
+    for stat, frame in zip(["alpha", "beta", "corr"], expected):
+        got = pd.read_csv(os.path.join(part, "close_rolling_{}.csv".format(stat)), index_col=0, parse_dates=True)
+        assert got.index.equals(frame.index)
+        np.testing.assert_allclose(got.to_numpy(), frame.to_numpy(), rtol=1e-9, atol=1e-12)
+
+def test_nothing_new_adds_nothing(tmp_path):
+    local = str(tmp_path / "local")
+    make_local(local)
+    part = str(tmp_path / "part")
+    run(local, part, "2020-01-01", "2020-12-31", ["-r"])
+    before = read_files(part)
+    run(local, part, "2020-01-01", "2021-01-03", ["-r", "--update"])
+    assert read_files(part) == before
+
+def test_unsorted_files_are_refused(tmp_path):
+    local = str(tmp_path / "local")
+    make_local(local)
+    part = str(tmp_path / "part")
+    run(local, part, "2020-01-01", "2020-06-30", [])
+    path = os.path.join(part, "high.csv")
+    frame = pd.read_csv(path, index_col=0)
+    frame.iloc[::-1].to_csv(path)
+    with pytest.raises(Exception, match="high.csv is not in date order"):
+        run(local, part, "2020-01-01", "2020-12-31", ["--update"])
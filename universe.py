@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+class UniverseResolver:
+    """
+    Universe resolver turns index names into ticker lists. Each source
+    is a (url, parse) pair where parse takes the page content and
+    returns the tickers. Lists are kept on disk in 'root' and reused
+    for 'ttl' seconds. After that the page is asked for again with the
+    ETag and Last-Modified it was served with, so an unchanged page
+    comes back as a 304 and is not parsed again. An empty root turns
+    the disk cache off.
+    """
+
+    def __init__(self, root="", ttl=24 * 60 * 60, timeout=30):
+        self.root = root
+        self.ttl = ttl
+        self.timeout = timeout
+        if root != "":
+            os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        """
+        Path gives the cache file for a source.
+        """
+        return os.path.join(self.root, "{}.json".format(name))
+
+    def load(self, name):
+        """
+        Load returns the cached entry for a source, or None.
+        """
+        if self.root == "" or not os.path.exists(self.path(name)):
+            return None
+        with open(self.path(name)) as f:
+            return json.load(f)
+
+    def save(self, name, entry):
+        """
+        Save writes the entry for a source to the cache.
+        """
+        if self.root == "":
+            return
+        tmp = self.path(name) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.path(name))
+
+    def get(self, name, url, parse):
+        """
+        Get returns the tickers of one source, from the cache if it is
+        fresh, otherwise by revalidating or downloading the page. If the
+        page can not be had, a stale cached list is used instead.
+        """
+        entry = self.load(name)
+        if entry is not None and time.time() - entry["fetched"] < self.ttl:
+            return entry["tickers"]
+
+        headers = dict()
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("modified"):
+                headers["If-Modified-Since"] = entry["modified"]
+
+        try:
+            page = requests.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            page = None
+        if page is not None and page.status_code == 304 and entry is not None: # Page has not changed since last time
+            entry["fetched"] = time.time()
+        elif page is None or not page.ok: # Keeping the stale list rather than parsing an error page
+            status = "no response" if page is None else page.status_code
+            if entry is None:
+                raise Exception("Could not get the {} members from {} ({})".format(name, url, status))
+            print("USING CACHED {} MEMBERS, {} ANSWERED WITH {}".format(name.upper(), url, status))
+            return entry["tickers"]
+        else:
+            entry = {
+                "tickers": parse(page.content),
+                "etag": page.headers.get("ETag"),
+                "modified": page.headers.get("Last-Modified"),
+                "fetched": time.time(),
+            }
+        self.save(name, entry)
+
+        return entry["tickers"]
+
+    def resolve(self, sources, workers=4):
+        """
+        Resolve gets every source in the dict of name to (url, parse)
+        at the same time and returns a dict of name to tickers.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = dict()
+            for name in sources:
+                url, parse = sources[name]
+                futures[name] = pool.submit(self.get, name, url, parse)
+
+            return {name: futures[name].result() for name in futures}